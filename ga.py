@@ -0,0 +1,68 @@
+import os
+import sys
+import runpy
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 子命令 -> (脚本路径, 说明)；脚本只在执行对应子命令时才载入
+COMMANDS = {
+    'unpack': ('junk/datfsts.py', "解包.dat/.fsts"),
+    'pack': ('junk/pfsts.py', "把目录打包为.dat"),
+    'idx': ('junk/idx.py', "把dat的索引同步到idx.dat"),
+    'extract': ('junk/extract.py', "按路径或通配符从.dat中提取文件"),
+    'patch': ('junk/patch.py', "替换.dat中的单个文件"),
+    'verify': ('junk/verify.py', "校验.dat"),
+    'diff': ('junk/diff.py', "对比两个.dat"),
+    'delta': ('junk/delta.py', "生成/应用.dat差分补丁"),
+    'layout': ('junk/layout.py', "模拟读取.dat的寻道和读取耗时"),
+    'lookup': ('junk/lookup.py', "按游戏内路径查找文件所在的dat"),
+    'bench': ('junk/bench.py', "LZSS基准测试"),
+    'tex': ('tex/textopng.py', "tex转png"),
+    'agi': ('tex/agipng.py', "agi转png"),
+    'png2agi': ('tex/png_agi.py', "png转agi"),
+    'agi-sync': ('tex/agi.py', "PNG文件同步"),
+    'fac': ('tex/facpng.py', "fac转png"),
+    'fac-viewer': ('tex/fac_viewer.py', "fac查看器"),
+    'makepng': ('tex/makepng.py', "批量生成文字PNG"),
+    'asb': ('asb/wtasb.py', "把翻译写回asb"),
+    'asb-code': ('asb/code.py', "asb反汇编"),
+    'asb-jd': ('asb/jd_str.py', "提取asb文本(jd)"),
+    'asb-yj': ('asb/yj_str.py', "提取asb文本(yj)"),
+    'tbl': ('tbl/tbl_str.py', "导出tbl文本为json"),
+    'tbl-write': ('tbl/wirte_tbl.py', "把翻译写回tbl"),
+    'tbl-xry': ('tbl/xrytbl.py', "把翻译写回tbl(xry)"),
+    'tbl-xryslg': ('tbl/xryslg_tbl.py', "把翻译写回slg的tbl(xry)"),
+    'slg': ('slg/slg_str.py', "提取slg文本"),
+    'voice': ('voice/voice.py', "整理语音"),
+    'voice-wj': ('voice/wj_voice.py', "整理语音(wj)"),
+    'msb': ('msb/msb.py', "导出msb音频"),
+    'font': ('字库/wtfont.py', "写入字库"),
+    'gaex': ('gaex/gaex.py', "解包gaex封包"),
+    'princess': ('gaex/PrincessConcerto.py', "解包PrincessConcerto封包"),
+}
+
+
+def usage():
+    print("用法: ga.py <子命令> [参数...]    子命令后加 -h 查看各自的参数\n")
+    for name, (script, description) in COMMANDS.items():
+        print(f"  {name:12} {description}  ({script})")
+
+
+def run(name, args):
+    script = os.path.join(ROOT, COMMANDS[name][0])
+    # 与直接运行脚本一致：脚本所在目录在sys.path最前，argv[0]为脚本
+    sys.path.insert(0, os.path.dirname(script))
+    sys.argv = [script] + args
+    # run_path 执行期间 sys.modules['__main__'] 指向该脚本，多进程(spawn)的子进程也能找到脚本里的函数
+    runpy.run_path(script, run_name='__main__')
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] in ('-h', '--help'):
+        usage()
+        sys.exit(0)
+    if sys.argv[1] not in COMMANDS:
+        print(f"未知的子命令: {sys.argv[1]}\n")
+        usage()
+        sys.exit(1)
+    run(sys.argv[1], sys.argv[2:])
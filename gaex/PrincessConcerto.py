@@ -2,6 +2,9 @@ import struct
 import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'junk'))
+import lzss
+
 def hex_print(*args, **kwargs):
     hex_args = [f"0x{int(x):X}" if isinstance(x, (int, float)) else str(x) for x in args]
     print(*hex_args, **kwargs)
@@ -43,61 +46,15 @@ def list_file(data):
 
 
 
-def decompress(data: bytes, output_size: int) -> bytes:
-    output = bytearray()
-    ring_buffer = bytearray(4096)  # 环形缓冲区
-    uVar8 = 0xFEE  # 初始环形缓冲区位置4078
-    uVar6 = 0       # 位缓冲区
-    pos = 0         # 当前处理的数据位置
-
-    while len(output) < output_size:
-        # 处理字面量或匹配对
-        while True:
-            uVar6 = (uVar6 >> 1) & 0xFFFF  # 右移一位并保持16位
-            if (uVar6 & 0x100) == 0:       # 检查是否需要补充位
-                if pos >= len(data):
-                    raise ValueError("数据不足，无法继续解压")
-                b = data[pos]
-                pos += 1
-                uVar6 = (b | 0xFF00) & 0xFFFF  # 更新位缓冲区
-            if (uVar6 & 1) == 0:          # 当前位为0，处理匹配对
-                break
-            # 处理字面量
-            if pos >= len(data):
-                raise ValueError("数据不足，无法读取字面量")
-            literal = data[pos]
-            pos += 1
-            output.append(literal)
-            ring_buffer[uVar8] = literal
-            uVar8 = (uVar8 + 1) & 0xFFF    # 更新环形缓冲区位置
-            if len(output) == output_size:
-                return bytes(output)
-
-        # 处理匹配对
-        if pos + 1 >= len(data):
-            raise ValueError("数据不足，无法读取匹配对信息")
-        bVar1 = data[pos]
-        bVar2 = data[pos + 1]
-        pos += 2
-        offset = ((bVar2 & 0xF0) << 4) | bVar1  # 计算偏移量
-        offset &= 0xFFF                          # 确保12位
-        length = (bVar2 & 0x0F) + 3              # 计算长度
-
-        # 复制匹配数据
-        for i in range(length):
-            src_pos = (offset + i) % 4096        # 源位置
-            value = ring_buffer[src_pos]
-            output.append(value)
-            ring_buffer[uVar8] = value           # 更新环形缓冲区
-            uVar8 = (uVar8 + 1) & 0xFFF
-            if len(output) == output_size:
-                return bytes(output)
-    
+def decompress(data: bytes, output_size: int, key: int = 0) -> bytes:
+    output = lzss.decode(data, output_size, key)
+    if len(output) < output_size:
+        raise ValueError("数据不足，无法继续解压")
     return bytes(output)
 
 
 
-def decrypt_data_from_checksum(data: bytes, checksum_value: int) -> bytes:
+def checksum_key(checksum_value: int) -> int:
 
     byte0 = checksum_value & 0xFF
     byte1 = (checksum_value >> 8) & 0xFF
@@ -106,13 +63,11 @@ def decrypt_data_from_checksum(data: bytes, checksum_value: int) -> bytes:
 
     v3_unsigned = (byte3 + byte2 + byte1 + byte0) & 0xFF
 
-    xor_key_byte = 0xAA if v3_unsigned == 0 else v3_unsigned
+    return 0xAA if v3_unsigned == 0 else v3_unsigned
 
-    decrypted_data = bytearray(len(data))
-    for i in range(len(data)):
-        decrypted_data[i] = data[i] ^ xor_key_byte
 
-    return bytes(decrypted_data)
+def decrypt_data_from_checksum(data: bytes, checksum_value: int) -> bytes:
+    return bytes(data).translate(lzss.xor_table(checksum_key(checksum_value)))
 
 
 
@@ -139,9 +94,8 @@ def parse_packed_file(input_file, output_dir):
             #print(f'{hex(current_offset)} {index} {hex(uncompressed)} {hex(compressed)} {hex(checksum)}')
             
             if compressed != 0:
-                x = decrypt_data_from_checksum(f.read(compressed), checksum)
-                data = decompress(x, uncompressed)
-                #hex_print(checksum, function_453660(x))
+                # 解密与解压在同一遍中完成
+                data = decompress(f.read(compressed), uncompressed, checksum_key(checksum))
                 
                 
             else:
@@ -0,0 +1,456 @@
+import io
+import os
+import sys
+import mmap
+import struct
+import fnmatch
+import hashlib
+from typing import NamedTuple, List, Dict
+
+import lzss
+
+PIDX_MAGIC = b'PIDX'
+FSTS_MAGIC = b'FSTS'
+
+# FSTS条目 16字节
+FSTS_FIELDS = ('name_offset', 'offset', 'uncompressed_size', 'size')
+# PIDX平铺索引条目 24字节 (idx.dat 及不含FSTS的dat)
+PIDX_FIELDS = ('type', 'name_offset', 'sign', 'offset', 'uncompressed_size', 'size')
+# PIDX子索引记录 20字节
+SUB_INDEX_FIELDS = ('name_offset', 'reserved', 'offset', 'size', 'count')
+
+# 打包时写在dat旁边的成员校验清单
+MANIFEST_SUFFIX = '.sums.json'
+
+
+class Folder(NamedTuple):
+    name: str
+    record: int        # 子索引记录在dat中的地址
+    offset: int        # FSTS在dat中的起始地址
+    size: int
+    count: int
+
+
+class Member(NamedTuple):
+    folder: str
+    name: str
+    entry: int         # FSTS条目在dat中的地址
+    offset: int        # 数据在dat中的绝对地址
+    uncompressed_size: int
+    size: int
+
+    @property
+    def path(self):
+        return self.folder + '/' + self.name
+
+
+def decode_name(raw):
+    try:
+        return bytes(raw).decode('shift-jis')  # 尝试日文编码
+    except UnicodeDecodeError:
+        return bytes(raw).decode('latin1')  # 回退到latin1编码
+
+
+def read_table(buf, offset, count, fields, stride=None):
+    """用 struct.iter_unpack 一次解出 count 条 uint32 记录，返回 {字段名: 列}
+
+    stride 为每条记录的字节数，记录末尾多出的字段跳过不解析
+    """
+    width = len(fields)
+    stride = stride or width * 4
+    end = offset + count * stride
+    if count <= 0:
+        return {field: () for field in fields}
+    if end > len(buf):
+        raise ValueError("索引表超出文件范围")
+    rows = struct.iter_unpack(f'<{width}I{stride - width * 4}x', buf[offset:end])
+    return dict(zip(fields, zip(*rows)))
+
+
+class NameTable:
+    """文件名表：整体按\\0切分一次，按相对偏移查名字"""
+
+    def __init__(self, buf, start, size=None):
+        self._buf = buf
+        self._start = start
+        end = len(buf) if size is None else min(start + size, len(buf))
+        self._raw = {}
+        self._decoded = {}
+        pos = 0
+        # 最后一段没有\0结尾(可能被截断)，留给逐个查找
+        for part in bytes(buf[start:end]).split(b'\x00')[:-1]:
+            self._raw[pos] = part
+            pos += len(part) + 1
+
+    def __getitem__(self, offset):
+        name = self._decoded.get(offset)
+        if name is None:
+            raw = self._raw.get(offset)
+            if raw is None:
+                # 指向字符串中间或表外的偏移，退回逐个查找
+                address = self._start + offset
+                end = self._buf.find(b'\x00', address)
+                raw = self._buf[address:end if end >= 0 else len(self._buf)]
+            name = decode_name(raw)
+            self._decoded[offset] = name
+        return name
+
+
+class Archive:
+    """mmap方式打开的PIDX0/FSTS封包，成员数据以memoryview切片返回，不做拷贝"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            if os.fstat(self._file.fileno()).st_size == 0:
+                raise ValueError(f"空文件: {path}")
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self.view = memoryview(self._mm)
+        self.folders: List[Folder] = []
+        self.members: List[Member] = []
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+        self._by_path: Dict[str, Member] = {m.path: m for m in self.members}
+        self._by_folder: Dict[str, List[Member]] = {f.name: [] for f in self.folders}
+        for m in self.members:
+            self._by_folder[m.folder].append(m)
+
+    def _int(self, address):
+        return struct.unpack_from('<I', self._mm, address)[0]
+
+    def _parse(self):
+        if self._mm[:4] != PIDX_MAGIC:
+            raise ValueError("无效的PIDX文件头")
+        if self._int(0x8) != 1:
+            raise ValueError("错误：无效的IDX文件")
+
+        self.start = self._int(0xC)
+        self.name_start = self._int(0x20)
+        sub_index_count = self._int(self.start)
+        names = NameTable(self._mm, self.name_start, self._int(0x24))
+
+        pointers = read_table(self._mm, self.start + 4, sub_index_count, ('pointer',))['pointer']
+        for pointer in pointers:
+            record = pointer + self.start
+            name_offset, _, fst_offset, fst_size, num = struct.unpack_from('<5I', self._mm, record)
+            self.folders.append(Folder(names[name_offset], record, fst_offset, fst_size, num))
+
+        for folder in self.folders:
+            self.members.extend(self._parse_fsts(folder))
+
+    def _parse_fsts(self, folder):
+        base = folder.offset
+        if self._mm[base:base + 4] != FSTS_MAGIC:
+            raise ValueError(f"无效的FSTS文件头: {folder.name}")
+        count, start, name_start, name_size = struct.unpack_from('<4I', self._mm, base + 4)
+        table = read_table(self._mm, base + start, count, FSTS_FIELDS)
+        names = NameTable(self._mm, base + name_start, name_size)
+        entries = range(base + start, base + start + count * 16, 16)
+        return [Member(folder.name, names[name_offset], entry, base + offset, uncompressed_size, size)
+                for entry, name_offset, offset, uncompressed_size, size
+                in zip(entries, table['name_offset'], table['offset'], table['uncompressed_size'], table['size'])]
+
+    @property
+    def header(self):
+        return self.view[:self.start]
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, path):
+        return path in self._by_path
+
+    def __getitem__(self, path):
+        return self._by_path[path]
+
+    def folder_members(self, folder):
+        return self._by_folder[folder]
+
+    def raw(self, member):
+        """返回成员的原始(压缩)数据切片"""
+        return self.view[member.offset:member.offset + member.size]
+
+    def read(self, member):
+        """返回成员解压后的数据，不是 3;1/3;0 格式时原样返回"""
+        return lzss.unpack(self.raw(member))
+
+    def open(self, member, buffer_size=io.DEFAULT_BUFFER_SIZE):
+        """以只读、可定位的文件对象打开成员，边读边解压，不在内存中保留整个文件
+
+        用完需关闭，否则封包无法关闭
+        """
+        if isinstance(member, str):
+            member = self[member]
+        return io.BufferedReader(MemberReader(self.raw(member), member.path), buffer_size)
+
+    def glob(self, patterns):
+        """按 目录名/文件名 通配匹配成员，保持封包内顺序"""
+        return [m for m in self.members if any(fnmatch.fnmatch(m.path, p) for p in patterns)]
+
+    def close(self):
+        if self._mm is None:
+            return
+        self.view.release()
+        self._mm.close()
+        self._file.close()
+        self._mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MemberReader(io.RawIOBase):
+    """成员数据的只读文件对象：3;1 增量解压，3;0 按块异或，其他格式原样读出
+
+    向后定位时从头重新解压
+    """
+
+    def __init__(self, raw, name=None):
+        self.name = name
+        self._raw = raw
+        self._pos = 0
+        size = lzss.header_size(raw)
+        if size is None:
+            self._kind = None
+            self._size = len(raw)
+        elif raw[3:4] == b'1':
+            self._kind = 'lzss'
+            self._size = size
+            self._body = raw[lzss.HEADER_SIZE:]
+            self._decoder = lzss.Decoder(self._body, size)
+        else:
+            self._kind = 'stored'
+            self._size = min(size, len(raw) - lzss.HEADER_SIZE)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        elif whence != io.SEEK_SET:
+            raise ValueError(f"无效的whence: {whence}")
+        if offset < 0:
+            raise ValueError(f"无效的位置: {offset}")
+        self._pos = offset
+        return offset
+
+    def readinto(self, b):
+        if self.closed:
+            raise ValueError("文件已关闭")
+        n = min(len(b), self._size - self._pos)
+        if n <= 0:
+            return 0
+        if self._kind == 'lzss':
+            data = self._read_lzss(n)
+        elif self._kind == 'stored':
+            start = lzss.HEADER_SIZE + self._pos
+            data = bytes(self._raw[start:start + n]).translate(lzss.xor_table(lzss.XOR_KEY))
+        else:
+            data = self._raw[self._pos:self._pos + n]
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def _read_lzss(self, n):
+        decoder = self._decoder
+        if self._pos < decoder.position:
+            decoder = self._decoder = lzss.Decoder(self._body, self._size)
+        decoder.skip(self._pos - decoder.position)
+        return decoder.read(n)
+
+    def close(self):
+        if not self.closed:
+            if self._kind == 'lzss':
+                self._decoder = None
+                self._body.release()
+            self._raw.release()
+        super().close()
+
+
+def checksum(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def content_digest(data):
+    """打包输入的内容校验值：已是 3;1/3;0 的先解开，与解包后得到的内容一致"""
+    return checksum(lzss.decompress(data) if lzss.is_packed(data) else data)
+
+
+# 进程池中每个进程各自打开(映射)一次的封包，作为 initializer 传给进程池
+_worker_archives = []
+
+def open_worker_archives(*filenames):
+    global _worker_archives
+    _worker_archives = [Archive(filename) for filename in filenames]
+
+def worker_view(which=0):
+    """当前工作进程中第 which 个封包的映射"""
+    return _worker_archives[which].view
+
+
+def align_up(value, align):
+    return (value + align - 1) // align * align
+
+
+class ArchiveWriter:
+    """流式写出PIDX0/FSTS封包：先预留文件头和索引，成员直接写入文件，最后回填偏移和大小
+
+    用法：
+        with ArchiveWriter(path, header, packname, folder_names) as writer:
+            writer.begin_folder(name, member_names)
+            writer.add(data, uncompressed_size)  # 按member_names顺序
+            writer.reuse(offset, uncompressed_size, size)  # 或指向本FSTS中已写出的数据
+            writer.end_folder()
+
+    子封包和成员数据可以按任意顺序写出(add/reuse 传入 index)，索引中的顺序不变
+    """
+
+    def __init__(self, path, header, packname, folder_names, align=16, member_align=16):
+        self.align = align
+        self.member_align = member_align
+        self.folder_names = list(folder_names)
+        # 可读写打开，重复的成员数据可以从已写出的部分读回
+        self._f = open(path, 'w+b')
+        self._folder = 0
+        self._done = set()
+
+        header = bytearray(header)
+        start = struct.unpack_from('<I', header, 0xC)[0]
+        count = len(self.folder_names)
+        self._pointer_table = start + 4
+        self._records = self._pointer_table + count * 4
+        names = bytearray(packname.encode() + b'\x00')
+        name_offsets = []
+        for name in self.folder_names:
+            name_offsets.append(len(names))
+            names.extend(name.encode() + b'\x00')
+
+        # 文件头 + 子索引指针 + 子索引记录(FSTS位置回填) + 文件名表
+        str_start = self._records + count * 20
+        index = bytearray(str_start - len(header))
+        index[0:0] = header
+        struct.pack_into('<I', index, start, count)
+        struct.pack_into('<I', index, 0x20, str_start)
+        struct.pack_into('<I', index, 0x24, len(names))
+        for i, name_offset in enumerate(name_offsets):
+            record = self._records + i * 20
+            struct.pack_into('<I', index, self._pointer_table + i * 4, record - start)
+            struct.pack_into('<I', index, record, name_offset)
+        self._f.write(index)
+        self._f.write(names)
+        self._pad(16)
+
+    def _pad(self, align):
+        pos = self._f.tell()
+        padding = align_up(pos, align) - pos
+        if padding:
+            self._f.write(b'\x00' * padding)
+        return pos + padding
+
+    def begin_folder(self, name, member_names):
+        """写出FSTS头和文件名表，条目表留空等待回填"""
+        if name not in self.folder_names or name in self._done:
+            raise ValueError(f"子封包不符: {name}")
+        self._folder = self.folder_names.index(name)
+        self._fst_offset = self._pad(self.align)
+        count = len(member_names)
+        str_start = 0x20 + count * 16
+        names = bytearray()
+        self._entries = []
+        for member_name in member_names:
+            self._entries.append([len(names), 0, 0, 0])
+            names.extend(member_name.encode() + b'\x00')
+        self._f.write(b'FSTS' + struct.pack('<4I', count, 0x20, str_start, len(names)) + bytes(12))
+        self._f.write(bytes(count * 16))
+        self._f.write(names)
+        self._pad(16)
+        self._member = 0
+
+    def add(self, data, uncompressed_size, index=None):
+        """写出一个成员的(压缩后)数据，index 为其在member_names中的位置(默认按顺序)，返回其在FSTS内的偏移"""
+        offset = self._pad(self.member_align) - self._fst_offset
+        self._f.write(data)
+        self._pad(16)
+        self._set_entry(index, offset, uncompressed_size, len(data))
+        return offset
+
+    def reuse(self, offset, uncompressed_size, size, index=None):
+        """成员直接指向本FSTS中已写出的数据，不再写入"""
+        self._set_entry(index, offset, uncompressed_size, size)
+
+    def _set_entry(self, index, offset, uncompressed_size, size):
+        entry = self._entries[self._member if index is None else index]
+        entry[1:] = offset, uncompressed_size, size
+        self._member += 1
+
+    @property
+    def fst_offset(self):
+        """当前FSTS在文件中的起始地址"""
+        return self._fst_offset
+
+    def read_back(self, address, size):
+        """读回已写出的数据"""
+        end = self._f.tell()
+        self._f.seek(address)
+        data = self._f.read(size)
+        self._f.seek(end)
+        return data
+
+    def end_folder(self):
+        """回填FSTS条目表和PIDX子索引记录"""
+        if self._member != len(self._entries):
+            raise ValueError("子封包成员数量不符")
+        end = self._f.tell()
+        self._f.seek(self._fst_offset + 0x20)
+        self._f.write(b''.join(struct.pack('<4I', *entry) for entry in self._entries))
+        self._f.seek(self._records + self._folder * 20 + 8)
+        self._f.write(struct.pack('<3I', self._fst_offset, end - self._fst_offset, len(self._entries)))
+        self._f.seek(end)
+        self._done.add(self.folder_names[self._folder])
+
+    def close(self):
+        if self._f.closed:
+            return
+        if len(self._done) != len(self.folder_names):
+            self._f.close()
+            raise ValueError("子封包数量不符")
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is not None:
+            self._f.close()
+        else:
+            self.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法：目标dat文件")
+    else:
+        with Archive(sys.argv[1]) as archive:
+            for m in archive:
+                print(f"{m.path}\t0x{m.offset:x}\t{m.uncompressed_size}\t{m.size}")
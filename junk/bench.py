@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+import lzss
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+SCRIPT_LINES = [
+    "「ミルフィーユ、紅茶が入りましたわよ」",
+    "タクト司令、エンジェル隊出撃準備完了です！",
+    "……えへへ、今日もいい天気ですね。",
+    "ランファ：ちょっと、それ私のケーキじゃない！",
+    "紋章機の整備は終わっているか？",
+]
+
+
+def zero_runs(size, rng):
+    """大段的0，中间夹少量随机字节"""
+    data = bytearray(size)
+    for _ in range(size // 512):
+        pos = rng.randrange(size)
+        data[pos:pos + 8] = rng.randbytes(8)
+    return bytes(data[:size])
+
+
+def texture(size, rng):
+    """16色调色板的像素，按行重复并带少量噪点"""
+    palette = rng.randbytes(16)
+    width = 256
+    row = bytes(palette[rng.randrange(16)] for _ in range(width))
+    data = bytearray()
+    while len(data) < size:
+        if rng.random() < 0.3:
+            row = bytes(palette[rng.randrange(16)] if rng.random() < 0.2 else b for b in row)
+        data += row
+    return bytes(data[:size])
+
+
+def script(size, rng):
+    """Shift-JIS 脚本文本"""
+    data = bytearray()
+    while len(data) < size:
+        data += rng.choice(SCRIPT_LINES).encode('shift-jis') + b'\r\n'
+    return bytes(data[:size])
+
+
+def noise(size, rng):
+    return rng.randbytes(size)
+
+
+def fill(size, rng):
+    """整段的0和两字节交替的填充，每个匹配都应能达到最长"""
+    return (bytes(size // 2) + b'\xff\x00' * size)[:size]
+
+
+CORPUS = {'zero': zero_runs, 'texture': texture, 'script': script, 'random': noise, 'fill': fill}
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(size, levels, repeat):
+    """返回 {"语料/等级": {encode_mbps, decode_mbps, ratio, encode_peak, decode_peak}}"""
+    results = {}
+    for name, generate in CORPUS.items():
+        data = generate(size, random.Random(name))
+        for level in levels:
+            encode_time, packed = best_time(lambda: lzss.compress(data, level=level), repeat)
+            # 解压耗时短、抖动大，多测几次
+            decode_time, unpacked = best_time(lambda: lzss.decompress(packed), repeat * 5)
+            if unpacked != data:
+                raise ValueError(f"解压结果不一致: {name} 等级{level}")
+            results[f"{name}/{level}"] = {
+                'encode_mbps': size / encode_time / 1e6,
+                'decode_mbps': size / decode_time / 1e6,
+                'ratio': len(packed) / size,
+                'encode_peak': peak_memory(lambda: lzss.compress(data, level=level)),
+                'decode_peak': peak_memory(lambda: lzss.decompress(packed)),
+            }
+            r = results[f"{name}/{level}"]
+            print(f"{name:8} 等级{level}  压缩 {r['encode_mbps']:7.2f} MB/s  解压 {r['decode_mbps']:7.2f} MB/s  "
+                  f"压缩率 {r['ratio']:.3f}  峰值内存 {r['encode_peak'] // 1024}/{r['decode_peak'] // 1024} KB")
+    return results
+
+
+def compare(results, baseline, threshold, speed=False):
+    """返回超出阈值的退步项：压缩率变差、内存增加，speed 时还有速度下降
+
+    速度与机器和负载有关，只在基线是本机测得时才有意义，默认不比较
+    """
+    regressions = []
+    for case, current in results.items():
+        base = baseline.get(case)
+        if base is None:
+            continue
+        for field in ('encode_mbps', 'decode_mbps'):
+            if speed and field in base and current[field] < base[field] * (1 - threshold):
+                regressions.append(f"{case} {field}: {base[field]:.2f} -> {current[field]:.2f}")
+        # 压缩率和内存与机器无关，只允许极小的误差
+        if current['ratio'] > base['ratio'] + 1e-6:
+            regressions.append(f"{case} ratio: {base['ratio']:.4f} -> {current['ratio']:.4f}")
+        for field in ('encode_peak', 'decode_peak'):
+            if current[field] > base[field] * (1 + threshold):
+                regressions.append(f"{case} {field}: {base[field]} -> {current[field]}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LZSS压缩/解压基准测试：速度、压缩率、峰值内存，并与基线对比")
+    parser.add_argument('--size', type=int, default=256 * 1024, help="每种语料的字节数 (默认256KB)")
+    parser.add_argument('-l', '--levels', type=int, nargs='+', default=[lzss.LEVEL_FAST, lzss.LEVEL_DEFAULT],
+                        help="测试的压缩等级 (默认 1 2)")
+    parser.add_argument('-n', '--repeat', type=int, default=3, help="每项重复次数，取最快一次 (默认3)")
+    parser.add_argument('-o', '--output', default=None, help="结果写入的JSON文件")
+    parser.add_argument('-b', '--baseline', default=BASELINE, help="对比的基线JSON (默认 bench_baseline.json)")
+    parser.add_argument('-t', '--threshold', type=float, default=0.3, help="速度/内存允许退步的比例 (默认0.3)")
+    parser.add_argument('--speed', action='store_true',
+                        help="同时对比速度(基线需在本机用 --speed --update-baseline 生成)；不加时基线中不写入速度")
+    parser.add_argument('--update-baseline', action='store_true', help="用本次结果覆盖基线")
+    args = parser.parse_args()
+
+    results = run(args.size, args.levels, args.repeat)
+    report = {'size': args.size, 'python': sys.version.split()[0], 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+    if args.update_baseline:
+        if not args.speed:
+            # 提交到仓库的基线只保存与机器无关的压缩率和峰值内存
+            report['results'] = {case: {k: v for k, v in r.items() if not k.endswith('_mbps')}
+                                 for case, r in results.items()}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+        print(f"基线已更新: {args.baseline}")
+        sys.exit(0)
+
+    try:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"没有基线文件: {args.baseline}")
+        sys.exit(0)
+    if baseline.get('size') != args.size:
+        print(f"基线的语料大小为 {baseline.get('size')}，与本次不同，不做对比")
+        sys.exit(0)
+    regressions = compare(results, baseline['results'], args.threshold, args.speed)
+    for line in regressions:
+        print(f"退步: {line}")
+    print(f"与基线对比：{len(regressions)} 项退步")
+    sys.exit(1 if regressions else 0)
@@ -1,95 +1,23 @@
 import os
-import sys
 import json
-from io import BytesIO
-
-def read_int(f, address=None):
-    if address is not None:
-        f.seek(address)
-    return int.from_bytes(f.read(4), 'little')
-
-def read_string(f, offset):
-    f.seek(offset)
-    string_bytes = bytearray()
-    while True:
-        char = f.read(1)
-        if char == b'\x00' or not char:
-            break
-        string_bytes.extend(char)
-    try:
-        return string_bytes.decode('shift-jis')  # 尝试日文编码
-    except UnicodeDecodeError:
-        return string_bytes.decode('latin1')  # 回退到latin1编码
+import zlib
+import struct
+import queue
+import argparse
+import threading
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+import lzss
+from archive import Archive, NameTable, read_table, FSTS_MAGIC, FSTS_FIELDS, open_worker_archives, worker_view
+
+# 解包日志：输出目录中每个已解出成员一行JSON，记录其偏移、压缩后大小和crc32
+JOURNAL_NAME = 'unpack.journal'
 
 def uncompress(data, output_dir, filename):
-    param_2 = int.from_bytes(data[4:8], 'little')
-    param_4 = len(data)
-    iVar4 = 8
-    iVar11 = 0
-    uVar7 = 0xfee
-    uVar10 = 0
-    abStack_1020 = bytearray(0x1020)
-    uncompress_data = bytearray()
-
-    compstate = False
-    if len(data) > 3 and (data[1] == ord('3') and data[2] == ord(';') and data[3] == ord('1')):
-        while True:
-            while True:
-                uVar10 >>= 1
-                uVar6 = uVar10
-                if (uVar10 & 0x100) == 0:
-                    if param_4 <= iVar4:
-                        return write_output(output_dir, filename, uncompress_data)
-                    pbVar8 = data[iVar4]
-                    iVar4 += 1
-                    uVar10 = (pbVar8 ^ 0x72) | 0xff00
-                    uVar6 = pbVar8 ^ 0x72
-
-                if (uVar6 & 1) != 0:
-                    break
-
-                if param_4 <= iVar4 + 1:
-                    return write_output(output_dir, filename, uncompress_data)
-
-                iVar9 = iVar4 + 1
-                bVar1 = data[iVar4]
-                iVar4 += 2
-                bVar2 = data[iVar9]
-                iVar9 = 0
-
-                while iVar9 <= ((bVar2 ^ 0x72) & 0xf) + 2:
-                    uVar6 = (bVar1 ^ 0x72 | ((bVar2 ^ 0x72) & 0xf0) << 4) + iVar9
-                    iVar9 += 1
-                    bVar3 = abStack_1020[uVar6 & 0xfff]
-                    if iVar11 >= param_2:
-                        break
-                    uncompress_data.append(bVar3)
-                    abStack_1020[uVar7] = bVar3
-                    uVar7 = (uVar7 + 1) & 0xfff
-                    iVar11 += 1
-
-            if param_4 <= iVar4:
-                break
-            bVar1 = data[iVar4]
-            iVar4 += 1
-            uncompress_byte = bVar1 ^ 0x72
-            if iVar11 >= param_2:
-                break
-            uncompress_data.append(uncompress_byte)
-            abStack_1020[uVar7] = uncompress_byte
-            uVar7 = (uVar7 + 1) & 0xfff
-            iVar11 += 1
-    elif len(data) > 3 and (data[1] == ord('3') and data[2] == ord(';') and data[3] == ord('0')):
-        if 8 < param_4:
-            for i in range(8, param_4):
-                uncompress_byte = data[i] ^ 0x72
-                if iVar11 >= param_2:
-                    break
-                uncompress_data.append(uncompress_byte)
-                iVar11 += 1
-    else:
+    uncompress_data = lzss.decompress(data)
+    if uncompress_data is None:
         return False
-
     return write_output(output_dir, filename, uncompress_data)
 
 def write_output(output_dir, filename, data):
@@ -99,97 +27,206 @@ def write_output(output_dir, filename, data):
         f.write(data)
     return True
 
+def extract_member(data, output_dir, name):
+    #filename = os.path.basename(name)
+    filename = name.replace('/', '\\')
+    print(name, os.path.dirname(filename))
+    os.makedirs(output_dir +"/"+  os.path.dirname(filename), exist_ok=True)
+    #compstate = False
+    #if filename.endswith(('.tbl', '.dat', '.txt')):
+    #    compstate = uncompress(data, output_dir, filename)
+    compstate = uncompress(data, output_dir, filename)
+    if not compstate:
+        write_output(output_dir, filename, data)
+    return filename
+
 def process_fsts(fst_data, output_dir):
-    f = BytesIO(fst_data)
-    magic = f.read(4)
-    if magic.decode('ascii') != 'FSTS':
+    if fst_data[:4] != FSTS_MAGIC:
         print("无效的FSTS文件头")
         return
 
-    entries = []
     rebuild = {}
     
-    IdxQ = read_int(f)
-    start = read_int(f)
-    name_start = read_int(f)
-
-    f.seek(start)
-    for _ in range(IdxQ):
-        name_offset = read_int(f)
-        offset = read_int(f)
-        uncompressSize = read_int(f)
-        size = read_int(f)
-        entries.append((name_offset, offset, uncompressSize, size))
-
-    for name_offset, offset, uncompressSize, size in entries:
-        name = read_string(f, name_start + name_offset)
-        #filename = os.path.basename(name)
-        filename = name.replace('/', '\\')
-        print(name, os.path.dirname(filename))
-        os.makedirs(output_dir +"/"+  os.path.dirname(filename), exist_ok=True)
-        rebuild[filename] = name
-        
-        f.seek(offset)
-        data = f.read(size)
-        #compstate = False
-        #if filename.endswith(('.tbl', '.dat', '.txt')):
-        #    compstate = uncompress(data, output_dir, filename)
-        compstate = uncompress(data, output_dir, filename)
-        if not compstate:
-                write_output(output_dir, filename, data)
+    IdxQ, start, name_start, name_size = struct.unpack_from('<4I', fst_data, 4)
+    table = read_table(fst_data, start, IdxQ, FSTS_FIELDS)
+    names = NameTable(fst_data, name_start, name_size)
+
+    for name_offset, offset, size in zip(table['name_offset'], table['offset'], table['size']):
+        name = names[name_offset]
+        data = fst_data[offset:offset + size]
+        rebuild[extract_member(data, output_dir, name)] = name
         
     return rebuild
 
-def process_pidx0(filename, output_dir):
-    with open(filename, 'rb') as f:
-        if f.read(4).decode('ascii') != 'PIDX':
-            print("无效的PIDX文件头")
-            return
-
-
-        if read_int(f,0x8) != 1:
-            print('错误：无效的IDX文件')
-            return
-
-        start = read_int(f, 0xC)
-        IdxQ = read_int(f, 0x10)
-        name_start = read_int(f, 0x20)
-        sub_index_count = read_int(f, 0x50)
-        f.seek(0)
-        list["start"] = f.read(start).hex()
-
-        sub_index_pointers = []
-        sub_index_start = start + 4
-        for i in range(sub_index_count):
-            pointer = read_int(f, sub_index_start + i*4)
-            sub_index_pointers.append(pointer + start)
-
-        for pointer in sub_index_pointers:
-            name_offset = read_int(f, pointer)
-            占位 = read_int(f, pointer + 4)
-            fst_offset = read_int(f, pointer + 8)
-            fst_size = read_int(f, pointer + 12)
-            num = read_int(f, pointer + 16)
-            
-            name = read_string(f, name_start + name_offset)
-            print(name)
-            
-            f.seek(fst_offset)
-            fst_data = f.read(fst_size)
-            
-            sub_output = os.path.join(output_dir, name)
-            list[name] = process_fsts(fst_data, sub_output)
+def _decode_task(task):
+    offset, size = task
+    return lzss.unpack(worker_view()[offset:offset + size])
+
+def extract_pipelined(filename, view, tasks, paths, jobs=1, writers=4, depth=None, done=None):
+    """解压与写文件重叠进行：进程池(或当前线程)解压，结果经有界队列交给写线程写出
+
+    tasks: [(偏移, 大小)]；paths: 对应的输出路径，所在目录需已建好
+    done(下标, 写入字节数) 在写线程中于文件写完后调用
+    """
+    depth = depth or max(jobs, writers) * 4
+    ready = queue.Queue(depth)
+    errors = []
+
+    def writer():
+        while True:
+            item = ready.get()
+            if item is None:
+                break
+            i, data = item
+            try:
+                with open(paths[i], 'wb') as f:
+                    f.write(data)
+                if done is not None:
+                    done(i, len(data))
+            except Exception as e:
+                errors.append((paths[i], e))
+
+    threads = [threading.Thread(target=writer, daemon=True) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    try:
+        if jobs > 1:
+            # 提交窗口有限，写得慢时解压也随之暂停，内存中最多 depth*2 个成员
+            with ProcessPoolExecutor(jobs, initializer=open_worker_archives, initargs=(filename,)) as pool:
+                futures = collections.deque()
+                for i, task in enumerate(tasks):
+                    futures.append((i, pool.submit(_decode_task, task)))
+                    if len(futures) >= depth:
+                        j, future = futures.popleft()
+                        ready.put((j, future.result()))
+                while futures:
+                    j, future = futures.popleft()
+                    ready.put((j, future.result()))
+        else:
+            for i, (offset, size) in enumerate(tasks):
+                ready.put((i, lzss.unpack(view[offset:offset + size])))
+    finally:
+        for _ in threads:
+            ready.put(None)
+        for thread in threads:
+            thread.join()
+    for path, e in errors:
+        print(f"写入失败: {path}: {e}")
+    return not errors
+
+def load_journal(path):
+    """读取解包日志，返回 {封包内路径: 记录}；中断时写了一半的行忽略"""
+    entries = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                entries[entry['path']] = entry
+    except FileNotFoundError:
+        pass
+    return entries
+
+def is_extracted(entry, member, crc, output_path):
+    """日志中记录的压缩数据与当前一致，且输出文件完整"""
+    if entry is None or entry['size'] != member.size or entry['crc'] != crc:
+        return False
+    try:
+        return os.path.getsize(output_path) == entry.get('written')
+    except OSError:
+        return False
+
+def process_pidx0(filename, output_dir, jobs=1, force=False, writers=4):
+    try:
+        archive = Archive(filename)
+    except ValueError as e:
+        print(e)
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    journal_path = os.path.join(output_dir, JOURNAL_NAME)
+    journal = {} if force else load_journal(journal_path)
+
+    with archive:
+        list["start"] = archive.header.hex()
+
+        members = []
+        tasks = []
+        for folder in archive.folders:
+            print(folder.name)
+            sub_output = os.path.join(output_dir, folder.name)
+            for member in archive.folder_members(folder.name):
+                members.append((member, sub_output))
+
+        # 压缩数据的crc与日志一致且输出文件完整的成员跳过
+        filenames = [None] * len(members)
+        entries = [None] * len(members)
+        pending = []
+        for i, (member, sub_output) in enumerate(members):
+            crc = zlib.crc32(archive.raw(member))
+            entry = journal.get(member.path)
+            if entry is not None and is_extracted(entry, member, crc, os.path.join(sub_output, entry['file'])):
+                filenames[i] = entry['file']
+                entries[i] = entry
+                continue
+            filenames[i] = member.name.replace('/', '\\')
+            entries[i] = {'path': member.path, 'offset': member.offset, 'size': member.size, 'crc': crc,
+                          'file': filenames[i]}
+            pending.append(i)
+            tasks.append((member.offset, member.size))
+        print(f"跳过未改动的 {len(members) - len(pending)} 个文件，解出 {len(pending)} 个")
+
+        # 输出目录按索引一次建好，写线程不再逐个makedirs
+        paths = [os.path.join(members[i][1], filenames[i]) for i in pending]
+        for directory in sorted({os.path.dirname(path) for path in paths}):
+            os.makedirs(directory, exist_ok=True)
+
+        # 每写完一个文件就追加一行日志，中断后重新运行从断点继续
+        with open(journal_path, 'a', encoding='utf-8') as log:
+            lock = threading.Lock()
+
+            def done(k, written):
+                entry = entries[pending[k]]
+                entry['written'] = written
+                with lock:
+                    print(entry['path'])
+                    log.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                    log.flush()
+
+            if not extract_pipelined(filename, archive.view, tasks, paths, jobs, writers, done=done):
+                # 已写完的文件都记在日志里，处理好出错的路径后重新运行即可继续
+                print("有文件写入失败，未生成list.json，请处理后重新运行")
+                return
+
+        # 按原顺序重建list.json
+        i = 0
+        for folder in archive.folders:
+            rebuild = {}
+            for member in archive.folder_members(folder.name):
+                rebuild[filenames[i]] = member.name
+                i += 1
+            list[folder.name] = rebuild
 
     with open(os.path.join(output_dir,'list.json'), 'w', encoding='utf-8') as f:
         json.dump(list, f, indent=4)
 
-def main(input_path, output_dir):
+    # 全部完成后整理日志，只保留当前成员的记录
+    with open(journal_path + '.tmp', 'w', encoding='utf-8') as f:
+        for entry in entries:
+            if 'written' not in entry:
+                continue
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    os.replace(journal_path + '.tmp', journal_path)
+
+def main(input_path, output_dir, jobs=1, force=False, writers=4):
     if not os.path.exists(input_path):
         print("输入路径不存在")
         return
 
     if os.path.isfile(input_path) and input_path.lower().endswith('.dat'):
-        process_pidx0(input_path, output_dir)
+        process_pidx0(input_path, output_dir, jobs, force, writers)
     elif os.path.isfile(input_path) and input_path.lower().endswith('.fsts'):
         with open(input_path, 'rb') as f:
             process_fsts(f.read(), output_dir)
@@ -197,8 +234,12 @@ def main(input_path, output_dir):
         print("不支持的文件类型")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("用法: python script.py <输入文件/目录> <输出目录>")
-    else:
-        list = {}
-        main(sys.argv[1], sys.argv[2])
+    parser = argparse.ArgumentParser(description="解包.dat/.fsts文件")
+    parser.add_argument('input', help="输入文件")
+    parser.add_argument('output', help="输出目录")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="并行解压的进程数 (默认1, 0为CPU核心数)")
+    parser.add_argument('-w', '--writers', type=int, default=4, help="写文件的线程数 (默认4)")
+    parser.add_argument('-f', '--force', action='store_true', help="忽略解包日志，全部重新解出")
+    args = parser.parse_args()
+    list = {}
+    main(args.input, args.output, args.jobs or os.cpu_count(), args.force, args.writers)
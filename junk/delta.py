@@ -0,0 +1,164 @@
+import os
+import mmap
+import zlib
+import struct
+import hashlib
+import argparse
+
+from archive import Archive
+
+PATCH_MAGIC = b'GADP'
+PATCH_VERSION = 1
+# 文件头：magic, 版本, 新文件大小, 操作数
+PATCH_HEADER = struct.Struct('<4sIQI')
+# 操作：类型, 旧文件偏移(COPY), 长度, crc32
+OP = struct.Struct('<BQII')
+OP_COPY = 0
+OP_DATA = 1
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def plan(old, new):
+    """按新dat的顺序列出 (类型, 旧文件偏移, 新文件偏移, 长度)
+
+    成员数据在旧dat中有完全相同的一份时从旧文件复制，
+    其余部分(索引、FSTS头、改动的成员)与旧文件同位置相同时也复制，否则写入补丁
+    """
+    old_view = old.view
+    new_view = new.view
+    by_size = {}
+    for m in old:
+        by_size.setdefault(m.size, []).append(m)
+    hashes = {}
+
+    def digest(archive, member):
+        key = (id(archive), member.offset, member.size)
+        if key not in hashes:
+            hashes[key] = hashlib.sha1(archive.raw(member)).digest()
+        return hashes[key]
+
+    ops = []
+
+    def region(start, end):
+        # 非成员数据或改动的成员：与旧文件同位置相同就复制
+        if start >= end:
+            return
+        if end <= len(old_view) and old_view[start:end] == new_view[start:end]:
+            ops.append((OP_COPY, start, start, end - start))
+        else:
+            ops.append((OP_DATA, 0, start, end - start))
+
+    pos = 0
+    for m in sorted(new, key=lambda m: m.offset):
+        if m.offset < pos:
+            # 多个条目共用同一份数据
+            continue
+        region(pos, m.offset)
+        source = None
+        for o in by_size.get(m.size, ()):
+            if digest(old, o) == digest(new, m):
+                source = o
+                break
+        if source is not None:
+            ops.append((OP_COPY, source.offset, m.offset, m.size))
+        else:
+            region(m.offset, m.offset + m.size)
+        pos = m.offset + m.size
+    region(pos, len(new_view))
+
+    # 合并相邻的同类操作
+    merged = []
+    for op in ops:
+        if merged:
+            kind, src, dst, length = merged[-1]
+            if kind == op[0] and dst + length == op[2] and (kind == OP_DATA or src + length == op[1]):
+                merged[-1] = (kind, src, dst, length + op[3])
+                continue
+        merged.append(op)
+    return merged
+
+
+def make(old_filename, new_filename, patch_filename):
+    with Archive(old_filename) as old, Archive(new_filename) as new:
+        ops = plan(old, new)
+        new_size = len(new.view)
+        with open(patch_filename, 'wb') as f:
+            f.write(PATCH_HEADER.pack(PATCH_MAGIC, PATCH_VERSION, new_size, len(ops)))
+            data_size = 0
+            for kind, src, dst, length in ops:
+                if kind == OP_COPY:
+                    f.write(OP.pack(kind, src, length, zlib.crc32(old.view[src:src + length])))
+                else:
+                    data = new.view[dst:dst + length]
+                    f.write(OP.pack(kind, 0, length, zlib.crc32(data)))
+                    f.write(data)
+                    data_size += length
+                    data.release()
+    print(f"{patch_filename}: {len(ops)} 个操作，补丁数据 {data_size} 字节，新文件 {new_size} 字节")
+
+
+def apply(target_filename, patch_filename, output_filename=None):
+    """按补丁从旧dat生成新dat，一次顺序读写；校验失败时不改动目标文件"""
+    output = output_filename or target_filename
+    tmp = output + '.tmp'
+    with open(patch_filename, 'rb') as p, open(target_filename, 'rb') as t, \
+            mmap.mmap(t.fileno(), 0, access=mmap.ACCESS_READ) as old, open(tmp, 'wb') as out:
+        try:
+            header = p.read(PATCH_HEADER.size)
+            if len(header) != PATCH_HEADER.size:
+                raise ValueError(f"不是有效的补丁文件: {patch_filename}")
+            magic, version, new_size, count = PATCH_HEADER.unpack(header)
+            if magic != PATCH_MAGIC or version != PATCH_VERSION:
+                raise ValueError(f"不是有效的补丁文件: {patch_filename}")
+            for i in range(count):
+                op = p.read(OP.size)
+                if len(op) != OP.size:
+                    raise ValueError("补丁文件不完整")
+                kind, src, length, crc = OP.unpack(op)
+                if kind == OP_COPY and src + length > len(old):
+                    raise ValueError(f"第{i}个操作超出目标文件范围，补丁与目标dat不匹配")
+                value = 0
+                done = 0
+                while done < length:
+                    n = min(BLOCK_SIZE, length - done)
+                    if kind == OP_COPY:
+                        block = old[src + done:src + done + n]
+                    else:
+                        block = p.read(n)
+                        if len(block) != n:
+                            raise ValueError("补丁文件不完整")
+                    value = zlib.crc32(block, value)
+                    out.write(block)
+                    done += n
+                if value != crc:
+                    raise ValueError(f"第{i}个操作校验失败，补丁与目标dat不匹配")
+            if out.tell() != new_size:
+                raise ValueError("生成的文件大小不符")
+        except Exception:
+            out.close()
+            os.remove(tmp)
+            raise
+    os.replace(tmp, output)
+    print(f"{target_filename} + {patch_filename} >> {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="dat差分补丁：只记录改动的成员数据和索引")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('make', help="由原版和修改后的dat生成补丁")
+    p.add_argument('old', help="原版dat")
+    p.add_argument('new', help="修改后的dat")
+    p.add_argument('patch', help="输出的补丁文件")
+    p = sub.add_parser('apply', help="把补丁应用到原版dat")
+    p.add_argument('target', help="原版dat")
+    p.add_argument('patch', help="补丁文件")
+    p.add_argument('-o', '--output', default=None, help="输出文件 (默认覆盖原版dat)")
+    args = parser.parse_args()
+    if args.command == 'make':
+        make(args.old, args.new, args.patch)
+    else:
+        try:
+            apply(args.target, args.patch, args.output)
+        except ValueError as e:
+            print(e)
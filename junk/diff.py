@@ -0,0 +1,81 @@
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from archive import Archive, checksum, open_worker_archives, worker_view
+from verify import check_member
+
+def _hash_task(task):
+    which, offset, size = task
+    return check_member(worker_view(which), offset, size)
+
+
+def diff(old_filename, new_filename, jobs=1):
+    """对比两个dat，返回 {'added', 'removed', 'changed', 'relocated': [路径]}
+
+    压缩后大小和原始数据都相同的成员直接视为未改动，不解压；
+    其余成员解压后比较内容；内容相同但在dat中的位置不同的记为 relocated
+    """
+    with Archive(old_filename) as old, Archive(new_filename) as new:
+        result = {
+            'added': [m.path for m in new if m.path not in old],
+            'removed': [m.path for m in old if m.path not in new],
+            'changed': [],
+            'relocated': [],
+        }
+        same_raw = []
+        # 需要解压比较的成员对，每对两个任务
+        pending = []
+        tasks = []
+        for m in new:
+            if m.path not in old:
+                continue
+            o = old[m.path]
+            if o.size == m.size and checksum(old.raw(o)) == checksum(new.raw(m)):
+                same_raw.append((o, m))
+                continue
+            pending.append((o, m))
+            tasks.append((0, o.offset, o.size))
+            tasks.append((1, m.offset, m.size))
+
+        if jobs > 1 and tasks:
+            chunksize = max(1, len(tasks) // (jobs * 8))
+            with ProcessPoolExecutor(jobs, initializer=open_worker_archives,
+                                     initargs=(old_filename, new_filename)) as pool:
+                hashes = list(pool.map(_hash_task, tasks, chunksize=chunksize))
+        else:
+            archives = (old, new)
+            hashes = [check_member(archives[which].view, offset, size) for which, offset, size in tasks]
+
+    unchanged = list(same_raw)
+    for i, (o, m) in enumerate(pending):
+        old_len, old_hash, old_error = hashes[2 * i]
+        new_len, new_hash, new_error = hashes[2 * i + 1]
+        if old_error or new_error or old_hash != new_hash:
+            result['changed'].append(m.path)
+        else:
+            # 只是重新压缩过，内容没变
+            unchanged.append((o, m))
+    for o, m in sorted(unchanged, key=lambda pair: pair[1].entry):
+        if o.offset != m.offset:
+            result['relocated'].append(m.path)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比两个dat，列出新增/删除/改动/移位的文件")
+    parser.add_argument('old', help="旧dat文件")
+    parser.add_argument('new', help="新dat文件")
+    parser.add_argument('-j', '--jobs', type=int, default=0, help="并行解压的进程数 (默认0为CPU核心数)")
+    parser.add_argument('-o', '--output', default=None, help="结果另存为JSON")
+    args = parser.parse_args()
+    result = diff(args.old, args.new, args.jobs or os.cpu_count())
+    for mark, key in (('+', 'added'), ('-', 'removed'), ('M', 'changed'), ('R', 'relocated')):
+        for path in result[key]:
+            print(f"{mark} {path}")
+    print(f"新增 {len(result['added'])}，删除 {len(result['removed'])}，"
+          f"改动 {len(result['changed'])}，移位 {len(result['relocated'])}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=1, ensure_ascii=False)
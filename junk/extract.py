@@ -0,0 +1,38 @@
+import os
+import argparse
+
+from archive import Archive
+
+
+def extract(dat_filename, patterns, output_dir='.', list_only=False):
+    try:
+        archive = Archive(dat_filename)
+    except (OSError, ValueError) as e:
+        print(e)
+        return []
+
+    with archive:
+        members = archive.glob(patterns)
+        if not members:
+            print("没有匹配的文件")
+            return []
+        for member in members:
+            if list_only:
+                print(f"{member.path}\t{member.uncompressed_size}\t{member.size}")
+                continue
+            output_path = os.path.join(output_dir, member.folder, *member.name.split('/'))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, 'wb') as f:
+                f.write(archive.read(member))
+            print(member.path)
+    return members
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从dat中按路径或通配符提取单个文件，无需完整解包")
+    parser.add_argument('dat', help="目标dat文件")
+    parser.add_argument('patterns', nargs='+', help="目录名/文件名，可用通配符，如 'tex/*.agi'")
+    parser.add_argument('-o', '--output', default='.', help="输出目录 (默认当前目录)")
+    parser.add_argument('-l', '--list', action='store_true', help="只列出匹配的文件")
+    args = parser.parse_args()
+    extract(args.dat, args.patterns, args.output, args.list)
@@ -1,151 +1,174 @@
-import sys
+import os
+import mmap
+import argparse
+import struct
 
-def read_int(f, address=None):
-    if address is not None:
-        f.seek(address)
-    return int.from_bytes(f.read(4), 'little')
-    
-def read_string(f, offset):
-    f.seek(offset)
-    string_bytes = bytearray()
-    while True:
-        char = f.read(1)
-        if char == b'\x00' or not char:
-            break
-        string_bytes.extend(char)
-    try:
-        return string_bytes.decode('shift-jis')  # 尝试日文编码
-    except UnicodeDecodeError:
-        return string_bytes.decode('latin1')  # 回退到latin1编码
+from archive import NameTable, read_table, PIDX_FIELDS
 
-def write_int(file, content, address=None):
-    if address is not None:
-        file.seek(address)
-    file.write(content.to_bytes(4, 'little'))
+def read_int(buf, address):
+    return struct.unpack_from('<I', buf, address)[0]
+    
+def read_sub_index(buf, start):
+    """读取子索引表，返回 [(记录地址, 名字偏移, FSTS偏移, FSTS大小, 文件数)]"""
+    IdxQ = read_int(buf, start) #总索引数量
+    pointers = read_table(buf, start + 4, IdxQ, ('pointer',))['pointer']
+    records = []
+    for pointer in pointers:
+        address = pointer + start
+        name_offset, _, fst_offset, fst_size, fst_sub = struct.unpack_from('<5I', buf, address)
+        records.append((address, name_offset, fst_offset, fst_size, fst_sub))
+    return records
 
 def dat_up(dat_filename):
-    with open(dat_filename, 'rb') as f:
-        magic = f.read(4)
-        if magic.decode('ascii') != 'PIDX':
-            print("文件头不符")
+    with open(dat_filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        if buf[:4] != b'PIDX':
+            print(f"文件头不符: {dat_filename}")
             return
         
-        entries = []
         dat_dict = {}
 
-        start = read_int(f,0xC) #索引起始地址
-        name_start = read_int(f,0x20) #文件名起始地址
-
-        if read_int(f, 0x14) != 0:
-            IdxQ = read_int(f,0x10) #总索引数量
-            f.seek(start)
-            for i in range(IdxQ):
-                type = read_int(f) #类型 若此值为1为文件夹
-                name_offset = read_int(f)
-                sign = read_int(f) #若为文件夹为该文件夹内文件数量
-                offset = read_int(f) #文件中起始偏移量
-                UncompressedSize = read_int(f)
-                size = read_int(f)
+        start = read_int(buf,0xC) #索引起始地址
+        names = NameTable(buf, read_int(buf,0x20), read_int(buf,0x24)) #文件名表
 
-                entries.append((i, type, name_offset, sign, offset,  UncompressedSize ,size))
-
-            for i, type, name_offset, sign, offset,  UncompressedSize ,size in entries:
+        if read_int(buf, 0x14) != 0:
+            IdxQ = read_int(buf,0x10) #总索引数量
+            # type 若此值为1为文件夹; sign 若为文件夹为该文件夹内文件数量; offset 文件中起始偏移量
+            table = read_table(buf, start, IdxQ, PIDX_FIELDS)
+            for type, name_offset, offset, UncompressedSize, size in zip(
+                    table['type'], table['name_offset'], table['offset'], table['uncompressed_size'], table['size']):
                 if type == 0:
-                    filename = read_string(f, name_start + name_offset)
-                    dat_dict[filename] =offset, UncompressedSize, size
+                    dat_dict[names[name_offset]] = offset, UncompressedSize, size
             return False,dat_dict
         
         else:
-            sub_index_pointers = []
-            IdxQ = read_int(f, start) #总索引数量
-            for i in range(IdxQ):
-                pointer = read_int(f, start + i*4 + 4)
-                sub_index_pointers.append(pointer + start)
-
-            for pointer in sub_index_pointers:
-                name_offset = read_int(f, pointer)
-                fst_offset = read_int(f, pointer + 2 * 4)
-                fst_size = read_int(f, pointer + 3 * 4)
-                fst_sub = read_int(f, pointer + 4 * 4)
-                name = read_string(f, name_start + name_offset)
-                dat_dict[name] = fst_offset, fst_size, fst_sub
+            for address, name_offset, fst_offset, fst_size, fst_sub in read_sub_index(buf, start):
+                dat_dict[names[name_offset]] = fst_offset, fst_size, fst_sub
             return True,dat_dict
             
 
-def idx_up(dat_filename, idx_filename):
-    
-    with open(idx_filename, 'rb+') as f:
-        dat标志数量 = read_int(f,0x8)
+class IdxIndex:
+    """idx.dat 一次载入后的 名字->记录地址 索引"""
+
+    def __init__(self, buf):
+        self.buf = buf
+        dat标志数量 = read_int(buf,0x8)
         if dat标志数量 == 1:
-            print("错误的idx文件")
-            return
+            raise ValueError("错误的idx文件")
+        self.names = NameTable(buf, read_int(buf,0x20), read_int(buf,0x24)) #文件名表
+        dat_str_offsets = read_table(buf, read_int(buf,0x4), dat标志数量, ('name_offset',), 32)['name_offset']
+        self.dats = {self.names[dat_str_offset]: dat_str_offset for dat_str_offset in dat_str_offsets}
+        # 子封包名 -> [子索引记录地址]
+        self.sub_records = {}
+        for address, name_offset, fst_offset, fst_size, fst_sub in read_sub_index(buf, read_int(buf, 0x18)):
+            self.sub_records.setdefault(self.names[name_offset], []).append(address)
+        self._files = None
 
-        dat_type, dat_dict = dat_up(dat_filename)
+    def dat_sign(self, dat_filename):
+        """dat在idx中的标志(名字偏移)，按原路径或文件名匹配"""
+        for name in (dat_filename, os.path.basename(dat_filename)):
+            if name in self.dats:
+                return self.dats[name]
+        return None
 
-        name_start = read_int(f,0x20) #文件名起始地址
-        dat标志地址 = read_int(f,0x4)
-        for i in range(read_int(f,0x8)):
-            dat_str_offset = read_int(f, dat标志地址 + i * 32)
-            dat_str = read_string(f, name_start + dat_str_offset)
-            if dat_str == dat_filename:
-                dat_sign = dat_str_offset
-            
-        if dat_sign is None:
-            print("idx中没有此dat文件")
-            return
-              
+    def file_records(self, dat_sign):
+        """平铺索引中属于该dat的 文件名 -> [条目地址]"""
+        if self._files is None:
+            self._files = {}
+            IdxQ = read_int(self.buf,0x10) #总索引数量
+            start = read_int(self.buf,0xC)
+            # type 若此值为1为文件夹; sign 若为文件夹为该文件夹内文件数量，否则为所在dat的标志
+            table = read_table(self.buf, start, IdxQ, PIDX_FIELDS)
+            for i, (type, name_offset, sign) in enumerate(zip(table['type'], table['name_offset'], table['sign'])):
+                if type == 0:
+                    files = self._files.setdefault(sign, {})
+                    files.setdefault(self.names[name_offset], []).append(start + i * 24)
+        return self._files.get(dat_sign, {})
+
+    def records_for(self, dat_type, dat_sign=None):
+        """返回 (名字 -> [记录地址], 三个值在记录中的起始字段)，与 dat_up 返回的值对应
+
+        子封包dat对应子索引记录中的 FSTS偏移、大小、文件数；
+        平铺dat对应平铺条目中的 偏移、解压后大小、大小
+        """
         if dat_type:
-            sub_index_pointers = []
-            start = read_int(f, 0x18)
-            IdxQ = read_int(f, start) #总索引数量
-            for i in range(IdxQ):
-                pointer = read_int(f, start + i*4 + 4)
-                sub_index_pointers.append(pointer + start)
-
-            for pointer in sub_index_pointers:
-                    
-                    name_offset = read_int(f, pointer)
-                    filename = read_string(f, name_start + name_offset)
-
-                    if filename in dat_dict:
-                        write_int(f, dat_dict[filename][0], pointer + 2 * 4)
-                        write_int(f, dat_dict[filename][1], pointer + 3 * 4)
-                        write_int(f, dat_dict[filename][2], pointer + 4 * 4)
-        else:
-            entries = []
-            IdxQ = read_int(f,0x10) #总索引数量
-            start = read_int(f,0xC)
-            f.seek(start)
-            for i in range(IdxQ):
-                address = f.tell()
-                type = read_int(f) #类型 若此值为1为文件夹
-                name_offset = read_int(f)
-                sign = read_int(f) #若为文件夹为该文件夹内文件数量
-                offset = read_int(f) #在对应dat文件中起始偏移量
-                UncompressedSize = read_int(f)
-                size = read_int(f)
-                
-                if sign == dat_sign and type == 0:
-                    entries.append((address, type, name_offset, sign, offset,  UncompressedSize ,size))
-            
-            f.seek(0)
-            for address, type, name_offset, sign, offset,  UncompressedSize ,size in entries:
-                filename = read_string(f, name_start + name_offset)
-                if filename in dat_dict:
-                    write_int(f, dat_dict[filename][0], address + 3 * 4)
-                    write_int(f, dat_dict[filename][1], address + 4 * 4)
-                    write_int(f, dat_dict[filename][2], address + 5 * 4)
-        
+            return self.sub_records, 2
+        return self.file_records(dat_sign), 3
+
+
+def sync(dat_filenames, idx_filename='idx.dat'):
+    """把多个dat的索引一次同步到idx.dat，返回未能对应上的 [(dat, 名字)]"""
+    unresolved = []
+    with open(idx_filename, 'rb+') as f, mmap.mmap(f.fileno(), 0) as buf:
+        try:
+            index = IdxIndex(buf)
+        except ValueError as e:
+            print(e)
+            return None
+
+        writes = []
+        for dat_filename in dat_filenames:
+            result = dat_up(dat_filename)
+            if result is None:
+                unresolved.append((dat_filename, None))
+                continue
+            dat_type, dat_dict = result
+
+            dat_sign = index.dat_sign(dat_filename)
+            if dat_sign is None:
+                print(f"idx中没有此dat文件: {dat_filename}")
+                unresolved.append((dat_filename, None))
+                continue
+
+            records, field = index.records_for(dat_type, dat_sign)
+            count = 0
+            for filename, values in dat_dict.items():
+                addresses = records.get(filename)
+                if not addresses:
+                    unresolved.append((dat_filename, filename))
+                    continue
+                for address in addresses:
+                    writes.append((address + field * 4, struct.pack('<3I', *values)))
+                    count += 1
+            print(f'{dat_filename} >> {idx_filename} 更正 {count} 条')
+
+        # 按地址顺序写入映射内存，最后统一刷盘
+        for address, data in sorted(writes):
+            buf[address:address + len(data)] = data
+        buf.flush()
+
+    for dat_filename, filename in unresolved:
+        if filename is not None:
+            print(f"未能在idx中找到: {dat_filename}: {filename}")
+    return unresolved
+
+
+def is_idx(filename):
+    """idx.dat 的0x8处为dat数量，普通dat为1"""
+    try:
+        with open(filename, 'rb') as f:
+            head = f.read(12)
+    except OSError:
+        return False
+    return len(head) == 12 and head[:4] == b'PIDX' and read_int(head, 0x8) != 1
+
+
+def idx_up(dat_filename, idx_filename):
+    return sync([dat_filename], idx_filename)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("用法：目标dat文件 idx.dat文件")
-    else:
-        dat_filename = sys.argv[1]
-        if len(sys.argv) == 3:
-            idx_filename = sys.argv[2]
+    parser = argparse.ArgumentParser(description="把dat的索引同步到idx.dat，可一次处理多个dat")
+    parser.add_argument('dats', nargs='+', help="目标dat文件")
+    parser.add_argument('-i', '--idx', default=None, help="idx.dat文件 (默认当前目录的idx.dat)")
+    args = parser.parse_args()
+    dat_filenames = args.dats
+    idx_filename = args.idx
+    if idx_filename is None:
+        # 兼容旧用法：目标dat文件 idx.dat文件
+        if len(dat_filenames) == 2 and is_idx(dat_filenames[1]):
+            idx_filename = dat_filenames.pop()
         else:
             idx_filename = 'idx.dat'
-        idx_up(dat_filename, idx_filename)
-        print(f'{dat_filename} >> idx.dat 更正完毕')
+    unresolved = sync(dat_filenames, idx_filename)
+    if unresolved is not None:
+        print(f'{len(dat_filenames)} 个dat >> {idx_filename} 更正完毕，未对应 {len(unresolved)} 项')
@@ -0,0 +1,111 @@
+import argparse
+
+from archive import Archive
+
+SECTOR_SIZE = 2048
+# 光盘读取的粗略模型：每次不连续读取的寻道耗时 和 连续读取速度
+SEEK_MS = 100.0
+READ_MBPS = 2.0
+
+STRATEGIES = ('list', 'size', 'trace')
+
+
+def load_trace(filename):
+    """访问记录：每行一个 目录名/文件名，按读取顺序"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        return [line.strip().replace('\\', '/') for line in f if line.strip()]
+
+
+def size_class(size):
+    # 按2的幂分档
+    return size.bit_length()
+
+
+def plan(folders, members, strategy='list', trace=None, sizes=None):
+    """决定数据在封包中的写出顺序，索引中的顺序不变
+
+    folders: [子封包名]；members: {子封包名: [文件名]}
+    sizes: {目录名/文件名: 大小}，size 策略使用
+    返回 (子封包写出顺序, {子封包名: [成员在members中的下标]})
+    """
+    order = {name: list(range(len(members[name]))) for name in folders}
+    if strategy == 'list':
+        return list(folders), order
+
+    if strategy == 'size':
+        # 同一子封包内按大小分档排列，小文件集中在一起
+        for name in folders:
+            names = members[name]
+            order[name].sort(key=lambda i: size_class(sizes.get(name + '/' + names[i], 0)))
+        return list(folders), order
+
+    if strategy == 'trace':
+        # 按第一次被访问的先后排列子封包和成员，没有访问记录的保持原顺序放在后面
+        first = {}
+        for i, path in enumerate(trace or ()):
+            first.setdefault(path, i)
+        never = len(first)
+        for name in folders:
+            names = members[name]
+            order[name].sort(key=lambda i: first.get(name + '/' + names[i], never))
+        folder_first = {name: min((first.get(name + '/' + n, never) for n in members[name]), default=never)
+                        for name in folders}
+        return sorted(folders, key=lambda name: folder_first[name]), order
+
+    raise ValueError(f"未知的排列方式: {strategy}")
+
+
+def simulate(archive, trace=None, sector=SECTOR_SIZE, seek_ms=SEEK_MS, read_mbps=READ_MBPS):
+    """按访问顺序模拟读取成员的耗时
+
+    每个成员按扇区读取；起始扇区与上次读完的位置不连续时计一次寻道，
+    上次读取的最后一个扇区视为仍在缓冲中，不重复读取
+    trace 为None时按索引顺序读取全部成员
+    """
+    if trace is None:
+        members = list(archive.members)
+    else:
+        members = [archive[path] for path in trace if path in archive]
+    seeks = 0
+    sectors = 0
+    head = None      # 磁头位置：下一个可以不寻道连续读的扇区
+    cached = None    # 上次读取的最后一个扇区，仍在缓冲中
+    for m in members:
+        first = m.offset // sector
+        last = (m.offset + max(m.size, 1) - 1) // sector
+        if first == cached:
+            first += 1
+        if first > last:
+            continue
+        if first != head:
+            seeks += 1
+        sectors += last - first + 1
+        head = last + 1
+        cached = last
+    read_ms = sectors * sector / (read_mbps * 1e6) * 1000
+    return {
+        'reads': len(members),
+        'seeks': seeks,
+        'sectors': sectors,
+        'seek_ms': seeks * seek_ms,
+        'read_ms': read_ms,
+        'total_ms': seeks * seek_ms + read_ms,
+    }
+
+
+def report(cost):
+    print(f"读取 {cost['reads']} 个文件：寻道 {cost['seeks']} 次，读取 {cost['sectors']} 个扇区，"
+          f"模拟耗时 {cost['total_ms']:.0f} ms (寻道 {cost['seek_ms']:.0f} + 读取 {cost['read_ms']:.0f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按访问记录模拟读取dat的寻道和读取耗时")
+    parser.add_argument('dat', help="目标dat文件")
+    parser.add_argument('-t', '--trace', default=None, help="访问记录，每行一个 目录名/文件名 (默认按索引顺序读取全部)")
+    parser.add_argument('--sector', type=int, default=SECTOR_SIZE, help=f"扇区大小 (默认{SECTOR_SIZE})")
+    parser.add_argument('--seek-ms', type=float, default=SEEK_MS, help=f"每次寻道耗时 (默认{SEEK_MS}ms)")
+    parser.add_argument('--read-mbps', type=float, default=READ_MBPS, help=f"连续读取速度 (默认{READ_MBPS}MB/s)")
+    args = parser.parse_args()
+    with Archive(args.dat) as archive:
+        trace = load_trace(args.trace) if args.trace else None
+        report(simulate(archive, trace, args.sector, args.seek_ms, args.read_mbps))
@@ -0,0 +1,161 @@
+import os
+import sys
+import mmap
+import struct
+import marshal
+import argparse
+from typing import NamedTuple
+
+import lzss
+from idx import IdxIndex, read_int
+from archive import read_table, PIDX_FIELDS
+
+CACHE_SUFFIX = '.lookup'
+CACHE_VERSION = 1
+# 缓存中每个文件一条：dat下标, 偏移, 原始大小, 大小
+RECORD = struct.Struct('<4I')
+
+
+class Location(NamedTuple):
+    dat: str
+    offset: int
+    uncompressed_size: int
+    size: int
+
+
+def normalize(path):
+    return path.replace('\\', '/').lower()
+
+
+class FileIndex:
+    """游戏内路径 -> 所在dat及位置，由idx.dat的平铺索引建立"""
+
+    def __init__(self, dats, paths, records):
+        self.dats = dats
+        self.paths = paths
+        self._records = records
+        # 原样的路径和统一分隔符/大小写后的路径都能查
+        self._by_path = dict(zip(paths, range(len(paths))))
+        for i, path in enumerate(paths):
+            self._by_path.setdefault(normalize(path), i)
+
+    @classmethod
+    def parse(cls, buf):
+        index = IdxIndex(buf)
+        dat_names = {sign: name for name, sign in index.dats.items()}
+        dats = list(index.dats)
+        dat_ids = {sign: i for i, sign in enumerate(index.dats.values())}
+        names = index.names
+
+        count = read_int(buf, 0x10)
+        table = read_table(buf, read_int(buf, 0xC), count, PIDX_FIELDS)
+        paths = []
+        records = bytearray()
+        folder = None
+        remaining = 0
+        for type, name_offset, sign, offset, uncompressed_size, size in zip(
+                table['type'], table['name_offset'], table['sign'],
+                table['offset'], table['uncompressed_size'], table['size']):
+            if type == 1:
+                # 文件夹条目：sign 为其后属于该文件夹的文件数
+                folder = names[name_offset]
+                remaining = sign
+                continue
+            name = names[name_offset]
+            if folder is not None and remaining > 0 and '/' not in name and '\\' not in name:
+                name = folder + '/' + name
+            remaining -= 1
+            if sign not in dat_names:
+                continue
+            paths.append(name)
+            records += RECORD.pack(dat_ids[sign], offset, uncompressed_size, size)
+        return cls(dats, paths, bytes(records))
+
+    @classmethod
+    def load(cls, idx_filename, use_cache=True):
+        """读取idx.dat；缓存文件与idx.dat大小和修改时间一致时直接读缓存"""
+        st = os.stat(idx_filename)
+        source = [st.st_size, st.st_mtime_ns]
+        cache_filename = idx_filename + CACHE_SUFFIX
+        if use_cache:
+            try:
+                with open(cache_filename, 'rb') as f:
+                    cache = marshal.load(f)
+                if cache.get('version') == CACHE_VERSION and cache.get('source') == source:
+                    return cls(cache['dats'], cache['paths'], cache['records'])
+            except (OSError, EOFError, ValueError, TypeError, AttributeError):
+                pass
+
+        with open(idx_filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            index = cls.parse(buf)
+        if use_cache:
+            try:
+                with open(cache_filename + '.tmp', 'wb') as f:
+                    marshal.dump({'version': CACHE_VERSION, 'source': source, 'dats': index.dats,
+                                  'paths': index.paths, 'records': index._records}, f)
+                os.replace(cache_filename + '.tmp', cache_filename)
+            except OSError as e:
+                print(f"无法写入缓存: {e}")
+        return index
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, path):
+        return path in self._by_path or normalize(path) in self._by_path
+
+    def get(self, path):
+        i = self._by_path.get(path)
+        if i is None:
+            i = self._by_path.get(normalize(path))
+            if i is None:
+                return None
+        dat, offset, uncompressed_size, size = RECORD.unpack_from(self._records, i * RECORD.size)
+        return Location(self.dats[dat], offset, uncompressed_size, size)
+
+    def __getitem__(self, path):
+        location = self.get(path)
+        if location is None:
+            raise KeyError(path)
+        return location
+
+    def read(self, path, dat_dir='.'):
+        """按游戏内路径读出文件内容(已解压)"""
+        location = self[path]
+        with open(os.path.join(dat_dir, location.dat), 'rb') as f:
+            f.seek(location.offset)
+            return lzss.unpack(f.read(location.size))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按游戏内路径查找文件所在的dat和位置")
+    parser.add_argument('idx', help="idx.dat文件")
+    parser.add_argument('paths', nargs='*', help="游戏内路径")
+    parser.add_argument('-o', '--output', default=None, help="把找到的文件解压后存到此目录")
+    parser.add_argument('--dat-dir', default=None, help="dat所在目录 (默认与idx.dat相同)")
+    parser.add_argument('--no-cache', action='store_true', help="不读写缓存文件")
+    args = parser.parse_args()
+
+    index = FileIndex.load(args.idx, not args.no_cache)
+    if not args.paths:
+        print(f"{args.idx}: {len(index)} 个文件，{len(index.dats)} 个dat")
+    missing = 0
+    for path in args.paths:
+        location = index.get(path)
+        if location is None:
+            print(f"找不到: {path}")
+            missing += 1
+            continue
+        print(f"{path}\t{location.dat}\t0x{location.offset:x}\t{location.uncompressed_size}\t{location.size}")
+        if args.output:
+            try:
+                data = index.read(path, args.dat_dir or os.path.dirname(os.path.abspath(args.idx)))
+            except OSError as e:
+                print(e)
+                missing += 1
+                continue
+            output_path = os.path.join(args.output, *path.replace('\\', '/').split('/'))
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, 'wb') as f:
+                f.write(data)
+    sys.exit(1 if missing else 0)
@@ -0,0 +1,606 @@
+import struct
+from array import array
+from typing import Optional
+
+XOR_KEY = 0x72
+WINDOW_SIZE = 4096
+MAX_MATCH_LEN = 18
+MIN_MATCH_LEN = 3
+MAX_DISTANCE = WINDOW_SIZE - 8
+RING_START = 0xFEE
+
+MAGIC_COMPRESSED = b'\x20\x33\x3B\x31'  # " 3;1"
+MAGIC_STORED = b'\x20\x33\x3B\x30'      # " 3;0"
+HEADER_SIZE = 8
+
+# 压缩等级：0 不压缩(3;0)，1 每个位置只试一个候选，2 完整哈希链查找最长匹配，3 最优解析
+LEVEL_STORE = 0
+LEVEL_FAST = 1
+LEVEL_DEFAULT = 2
+LEVEL_OPTIMAL = 3
+
+# 每个记号占用的位数(含控制位)
+LITERAL_BITS = 1 + 8
+MATCH_BITS = 1 + 16
+
+# 可压缩性估计：抽样的块数和块大小，以及抽样时哈希链的查找深度
+ESTIMATE_BLOCKS = 8
+ESTIMATE_BLOCK_SIZE = 4096
+ESTIMATE_CHAIN = 8
+
+_xor_tables = {}
+
+# 每个控制字节从低位开始连续的1(字面量)个数
+_LITERAL_RUN = bytes((~v & (v + 1)).bit_length() - 1 for v in range(256))
+
+
+def _segments(flags):
+    # 把控制字节拆成 字面量连续个数(>0) / 匹配(0) 的序列
+    segments = []
+    bit = 0
+    while bit < 8:
+        run = _LITERAL_RUN[flags >> bit]
+        if run:
+            segments.append(run)
+            bit += run
+        else:
+            segments.append(0)
+            bit += 1
+    return tuple(segments)
+
+
+_SEGMENTS = tuple(_segments(v) for v in range(256))
+# 一组(1个控制字节+8个记号)最多占用的输入/输出字节数
+_GROUP_IN = 1 + 8 * 2
+_GROUP_OUT = 8 * MAX_MATCH_LEN
+
+
+def xor_table(key):
+    table = _xor_tables.get(key)
+    if table is None:
+        table = bytes(i ^ key for i in range(256))
+        _xor_tables[key] = table
+    return table
+
+
+def decode(data, size, key=XOR_KEY):
+    """解压不带文件头的LZSS数据流，数据不足时返回已解出的部分"""
+    src = bytes(data).translate(xor_table(key)) if key else bytes(data)
+    n = len(src)
+    # 输出前预留一个环形缓冲区大小的0，匹配引用初始缓冲区时直接读到0
+    out = bytearray(WINDOW_SIZE + size + _GROUP_OUT)
+    o = WINDOW_SIZE
+    end = WINDOW_SIZE + size
+    # 环形缓冲区位置 = (o - WINDOW_SIZE + RING_START) & 0xFFF
+    ring_base = RING_START - WINDOW_SIZE
+    segments = _SEGMENTS
+    i = 0
+
+    # 快速路径：剩余输入足够一整组时不做逐个记号的边界检查，输出多写的部分最后截掉
+    fast_end = n - _GROUP_IN
+    while o < end and i <= fast_end:
+        flags = src[i]
+        if flags == 0xFF:
+            # 连续的全字面量组：用步长切片一次性去掉控制字节
+            groups = 1
+            limit = min((fast_end - i) // 9, (end - o) // 8)
+            while groups < limit and src[i + groups * 9] == 0xFF:
+                groups += 1
+            if groups > 1:
+                span = groups * 9
+                for k in range(8):
+                    out[o + k:o + groups * 8:8] = src[i + 1 + k:i + span:9]
+                o += groups * 8
+                i += span
+                continue
+        i += 1
+        for run in segments[flags]:
+            if run == 1:
+                out[o] = src[i]
+                o += 1
+                i += 1
+            elif run:
+                out[o:o + run] = src[i:i + run]
+                o += run
+                i += run
+            else:
+                b2 = src[i + 1]
+                length = (b2 & 0x0F) + MIN_MATCH_LEN
+                distance = (o + ring_base - (src[i] | (b2 & 0xF0) << 4)) & 0xFFF or WINDOW_SIZE
+                i += 2
+                s = o - distance
+                if distance >= length:
+                    out[o:o + length] = out[s:s + length]
+                else:
+                    # 重叠匹配：按周期重复
+                    out[o:o + length] = (out[s:o] * (length // distance + 1))[:length]
+                o += length
+
+    # 末尾几组逐个记号检查输入是否耗尽
+    while o < end and i < n:
+        flags = src[i]
+        i += 1
+        bit = 0
+        while bit < 8 and o < end:
+            if (flags >> bit) & 1:
+                run = _LITERAL_RUN[flags >> bit]
+                if i + run > n:
+                    run = n - i
+                    if run == 0:
+                        break
+                out[o:o + run] = src[i:i + run]
+                o += run
+                i += run
+                bit += run
+            else:
+                if i + 1 >= n:
+                    i = n
+                    break
+                b2 = src[i + 1]
+                length = (b2 & 0x0F) + MIN_MATCH_LEN
+                distance = (o + ring_base - (src[i] | (b2 & 0xF0) << 4)) & 0xFFF or WINDOW_SIZE
+                i += 2
+                s = o - distance
+                if distance >= length:
+                    out[o:o + length] = out[s:s + length]
+                else:
+                    out[o:o + length] = (out[s:o] * (length // distance + 1))[:length]
+                o += length
+                bit += 1
+    return out[WINDOW_SIZE:min(o, end)]
+
+
+class Decoder:
+    """增量解压不带文件头的LZSS数据流，只保留一个环形缓冲区大小的历史输出
+
+    data 可以是memoryview，输入按块异或，不会整体复制
+    """
+
+    def __init__(self, data, size, key=XOR_KEY, chunk=64 * 1024):
+        self._data = data
+        self._table = xor_table(key) if key else None
+        self.size = size
+        self.position = 0         # 已经由read返回的字节数
+        self._chunk = chunk
+        self._src = b''
+        self._i = 0               # _src中的读取位置
+        self._next = 0            # 下一块未异或输入的起始位置
+        # 前WINDOW_SIZE字节为历史输出(初始为0)，之后为已解出但未读走的部分
+        self._out = bytearray(WINDOW_SIZE)
+        self._produced = 0        # 已解出的总字节数
+
+    def _more(self):
+        # 保证剩余输入不少于一整组，输入已读完时返回False
+        if len(self._src) - self._i >= _GROUP_IN or self._next >= len(self._data):
+            return len(self._src) > self._i
+        chunk = bytes(self._data[self._next:self._next + self._chunk])
+        self._next += len(chunk)
+        if self._table:
+            chunk = chunk.translate(self._table)
+        self._src = self._src[self._i:] + chunk
+        self._i = 0
+        return True
+
+    def _fill(self, want):
+        # 解出的未读部分达到want字节或到达结尾为止
+        out = self._out
+        target = WINDOW_SIZE + want
+        while len(out) < target and self._produced < self.size and self._more():
+            src = self._src
+            n = len(src)
+            i = self._i
+            flags = src[i]
+            i += 1
+            produced = len(out)
+            for run in _SEGMENTS[flags]:
+                if run:
+                    out += src[i:i + run]
+                    i += run
+                else:
+                    if i + 1 >= n:
+                        i = n
+                        break
+                    b2 = src[i + 1]
+                    length = (b2 & 0x0F) + MIN_MATCH_LEN
+                    # 当前写入位置在环形缓冲区中的位置 = (已解出字节数 + RING_START) & 0xFFF
+                    write_pos = self._produced + len(out) - produced + RING_START
+                    distance = (write_pos - (src[i] | (b2 & 0xF0) << 4)) & 0xFFF or WINDOW_SIZE
+                    i += 2
+                    s = len(out) - distance
+                    if distance >= length:
+                        out += out[s:s + length]
+                    else:
+                        out += (out[s:] * (length // distance + 1))[:length]
+                if i >= n:
+                    break
+            self._i = min(i, n)
+            self._produced += len(out) - produced
+        # 组内超出原始大小的部分丢弃
+        extra = self._produced - self.size
+        if extra > 0:
+            del out[len(out) - extra:]
+            self._produced = self.size
+
+    def read(self, n=-1):
+        """返回接下来的至多n字节，n<0时读到结尾"""
+        if n is None or n < 0:
+            n = self.size - self.position
+        self._fill(n)
+        out = self._out
+        data = bytes(out[WINDOW_SIZE:WINDOW_SIZE + n])
+        # 读走的部分并入历史，只保留最后WINDOW_SIZE字节
+        del out[:len(data)]
+        self.position += len(data)
+        return data
+
+    def skip(self, n):
+        """丢弃接下来的n字节，返回实际丢弃的字节数"""
+        skipped = 0
+        while skipped < n:
+            data = self.read(min(n - skipped, 1024 * 1024))
+            if not data:
+                break
+            skipped += len(data)
+        return skipped
+
+
+def header_size(data) -> Optional[int]:
+    """若为 3;1/3;0 格式返回文件头中的原始大小，否则返回None"""
+    if len(data) > 3 and data[1:4] in (b'3;1', b'3;0'):
+        return struct.unpack_from('<I', data, 4)[0] if len(data) >= HEADER_SIZE else 0
+    return None
+
+
+def is_packed(data):
+    """是否已是带 3;1/3;0 文件头的数据(打包时原样写入)"""
+    return data[:4] == MAGIC_COMPRESSED or data[:4] == MAGIC_STORED
+
+
+def decompress(data, key=XOR_KEY) -> Optional[bytes]:
+    """解压带 3;1/3;0 文件头的数据，不是这两种格式时返回None"""
+    size = header_size(data)
+    if size is None:
+        return None
+    if data[3:4] == b'1':
+        return bytes(decode(data[HEADER_SIZE:], size, key))
+    return bytes(data[HEADER_SIZE:HEADER_SIZE + size]).translate(xor_table(key))
+
+
+def unpack(data, key=XOR_KEY) -> bytes:
+    """解压 3;1/3;0 数据，不是这两种格式时原样返回"""
+    uncompress_data = decompress(data, key)
+    return bytes(data) if uncompress_data is None else uncompress_data
+
+
+class MatchFinder:
+    """以3字节前缀为键的哈希链匹配查找器，max_chain限制每次查找遍历的候选数(None为不限)
+
+    与zlib相同，链只保存最近一个窗口：prev 按 位置 & (WINDOW_SIZE-1) 循环使用，
+    head 定期清掉窗口外的前缀，内存占用与输入大小无关
+    """
+
+    def __init__(self, data, max_chain=None):
+        self.data = data
+        self.size = len(data)
+        self.max_chain = max_chain or self.size + 1
+        self.head = {}
+        self.prev = array('i', [-1]) * WINDOW_SIZE
+        self.inserted = 0
+        self.pruned = 0
+
+    def insert_until(self, end):
+        # 把 [inserted, end) 之间的位置挂到各自的哈希链上
+        data = self.data
+        head = self.head
+        prev = self.prev
+        mask = WINDOW_SIZE - 1
+        stop = min(end, self.size - MIN_MATCH_LEN + 1)
+        for p in range(self.inserted, stop):
+            key = data[p:p + MIN_MATCH_LEN]
+            prev[p & mask] = head.get(key, -1)
+            head[key] = p
+        if end > self.inserted:
+            self.inserted = end
+        if self.inserted - self.pruned >= 2 * WINDOW_SIZE:
+            # 最近一次出现已在窗口外的前缀不会再被匹配到
+            limit = self.inserted - MAX_DISTANCE
+            self.head = {key: p for key, p in head.items() if p >= limit}
+            self.pruned = self.inserted
+
+    def find(self, cursor, end=None):
+        """返回 cursor 处的 (最长匹配长度, 源位置)，不足 MIN_MATCH_LEN 时返回 (0, 0)"""
+        data = self.data
+        max_len = min(MAX_MATCH_LEN, (end if end is not None else self.size) - cursor)
+        if max_len < MIN_MATCH_LEN:
+            return 0, 0
+        self.insert_until(cursor)
+        candidate = self.head.get(data[cursor:cursor + MIN_MATCH_LEN], -1)
+        limit = cursor - MAX_DISTANCE
+        prev = self.prev
+        mask = WINDOW_SIZE - 1
+        target = data[cursor:cursor + max_len]
+        best_len = 0
+        best_pos = 0
+        depth = self.max_chain
+        while candidate >= limit and candidate >= 0 and depth:
+            # 与原实现一致，匹配不与当前位置重叠
+            cap = cursor - candidate
+            if cap < MIN_MATCH_LEN:
+                # 离当前位置太近，放不下最短匹配，不计入查找深度
+                candidate = prev[candidate & mask]
+                continue
+            if cap > max_len:
+                cap = max_len
+            # 先比较当前最长长度处的字节，不可能更长的候选直接跳过
+            if cap > best_len and (best_len == 0 or data[candidate + best_len] == target[best_len]):
+                if data[candidate:candidate + cap] == target[:cap]:
+                    length = cap
+                else:
+                    length = MIN_MATCH_LEN
+                    while data[candidate + length] == target[length]:
+                        length += 1
+                if length > best_len:
+                    best_len = length
+                    best_pos = candidate
+                    if length == max_len:
+                        break
+            # 窗口外的位置其槽位可能已被覆盖，由循环条件中的 limit 截止
+            candidate = prev[candidate & mask]
+            depth -= 1
+        return (best_len, best_pos) if best_len else (0, 0)
+
+
+class FastMatchFinder:
+    """每个3字节前缀只记最近一次出现的位置，只试这一个候选；匹配内部的位置不登记"""
+
+    def __init__(self, data, start=0):
+        self.data = data
+        self.size = len(data)
+        self.head = {}
+        # start 之前的数据只作为字典：每个位置都登记
+        for p in range(min(start, self.size - MIN_MATCH_LEN + 1)):
+            self.head[data[p:p + MIN_MATCH_LEN]] = p
+
+    def find(self, cursor, end=None):
+        data = self.data
+        max_len = min(MAX_MATCH_LEN, (end if end is not None else self.size) - cursor)
+        if max_len < MIN_MATCH_LEN:
+            return 0, 0
+        key = data[cursor:cursor + MIN_MATCH_LEN]
+        candidate = self.head.get(key, -1)
+        # 离当前位置太近的候选受“不重叠”限制匹配不长(连续相同字节时甚至为0)，
+        # 保留它直到距离够一个最长匹配，连续重复的数据才能逐步拉长匹配
+        if candidate < 0 or cursor - candidate >= MAX_MATCH_LEN:
+            self.head[key] = cursor
+        if candidate < 0 or cursor - candidate > MAX_DISTANCE:
+            return 0, 0
+        # 与 MatchFinder 相同，匹配不与当前位置重叠
+        cap = min(cursor - candidate, max_len)
+        if cap < MIN_MATCH_LEN:
+            return 0, 0
+        length = MIN_MATCH_LEN
+        while length < cap and data[candidate + length] == data[cursor + length]:
+            length += 1
+        return length, candidate
+
+
+def _stream_size(tokens, literals):
+    # 记号数对应的控制字节 + 字面量1字节 + 匹配2字节
+    return (tokens + 7) // 8 + literals + (tokens - literals) * 2
+
+
+class OptimalParser:
+    """先求出每个位置的最长匹配，再从后往前动态规划，使总位数最少
+
+    在同样的匹配数据上，贪心解析(总取最长匹配)的大小记在 greedy_size
+    start: 之前的数据只作为字典，greedy_size/optimal_size 只计 start 之后的部分
+    """
+
+    def __init__(self, data, max_chain=None, start=0):
+        size = len(data)
+        finder = MatchFinder(data, max_chain)
+        longest = [0] * size
+        source = [0] * size
+        for cursor in range(size):
+            longest[cursor], source[cursor] = finder.find(cursor)
+
+        # cost[i]: 从i编码到结尾所需的最少位数；choice[i]: i处选用的匹配长度(0为字面量)
+        cost = [0] * (size + 1)
+        choice = [0] * size
+        for i in range(size - 1, -1, -1):
+            best = cost[i + 1] + LITERAL_BITS
+            m = longest[i]
+            if m:
+                # 同一源位置的更短匹配同样有效
+                targets = cost[i + MIN_MATCH_LEN:i + m + 1]
+                c = min(targets) + MATCH_BITS
+                if c <= best:
+                    best = c
+                    choice[i] = targets.index(c - MATCH_BITS) + MIN_MATCH_LEN
+            cost[i] = best
+        self.choice = choice
+        self.source = source
+        self.greedy_size = self._size(longest, start)
+        self.optimal_size = self._size(choice, start)
+
+    @staticmethod
+    def _size(lengths, start=0):
+        tokens = literals = 0
+        cursor = start
+        while cursor < len(lengths):
+            tokens += 1
+            if lengths[cursor]:
+                cursor += lengths[cursor]
+            else:
+                literals += 1
+                cursor += 1
+        return HEADER_SIZE + _stream_size(tokens, literals)
+
+    def find(self, cursor, end=None):
+        length = self.choice[cursor]
+        return (length, self.source[cursor]) if length else (0, 0)
+
+
+def make_finder(data, level=LEVEL_DEFAULT, max_chain=None, start=0):
+    """按压缩等级建立匹配查找器；start 之前的数据只作为字典"""
+    if level == LEVEL_FAST:
+        return FastMatchFinder(data, start)
+    if level == LEVEL_OPTIMAL:
+        return OptimalParser(data, max_chain, start)
+    return MatchFinder(data, max_chain)
+
+
+def encode(data, key=XOR_KEY, max_chain=None, level=LEVEL_DEFAULT, finder=None) -> bytearray:
+    """压缩为不带文件头的LZSS数据流，finder 为已建好的匹配查找器(可选)"""
+    data = bytes(data)
+    size = len(data)
+    if finder is None:
+        finder = make_finder(data, level, max_chain)
+    out = bytearray()
+    cursor = 0
+    flags = 0
+    bit = 8
+    flag_pos = None
+
+    while cursor < size:
+        if bit == 8:
+            if flag_pos is not None:
+                out[flag_pos] = flags
+            flag_pos = len(out)
+            out.append(0)
+            flags = 0
+            bit = 0
+
+        length, pos = finder.find(cursor)
+        if length:
+            # 距离字段为环形缓冲区中的绝对位置
+            ring = (pos + RING_START) & 0xFFF
+            out.append(ring & 0xFF)
+            out.append(((ring >> 4) & 0xF0) | (length - MIN_MATCH_LEN))
+            cursor += length
+        else:
+            flags |= 1 << bit
+            out.append(data[cursor])
+            cursor += 1
+        bit += 1
+
+    if flag_pos is not None:
+        out[flag_pos] = flags
+    return out.translate(xor_table(key)) if key else out
+
+
+def _pad_tokens(lengths, sources, need):
+    """把靠后的匹配拆出字面量，使记号数恰好增加 need 个(need < 8)
+
+    长度为m的匹配从头拆出a个字面量(剩余匹配仍不短于 MIN_MATCH_LEN)可增加a个记号，
+    全部改为字面量增加 m-1 个；从后往前找到能凑出 need 的最短后缀
+    """
+    # 增加的记号数 -> [(下标, 该匹配增加的记号数)]
+    reach = {0: []}
+    for i in range(len(lengths) - 1, -1, -1):
+        if need in reach:
+            break
+        m = lengths[i]
+        if not m:
+            continue
+        adds = [a for a in range(1, m - MIN_MATCH_LEN + 1)] + [m - 1]
+        for total, choice in list(reach.items()):
+            for a in adds:
+                if total + a <= need and total + a not in reach:
+                    reach[total + a] = choice + [(i, a)]
+    if need not in reach:
+        raise ValueError("无法补齐控制字节分组：分段长度须为8的倍数")
+    # 从后往前替换，前面的下标不受影响
+    for i, a in reach[need]:
+        m = lengths[i]
+        if a == m - 1:
+            lengths[i:i + 1] = [0] * m
+            sources[i:i + 1] = [0] * m
+        else:
+            lengths[i:i + 1] = [0] * a + [m - a]
+            sources[i:i + 1] = [0] * a + [sources[i] + a]
+
+
+def encode_chunk(window, start, base=0, pad=False, key=XOR_KEY, max_chain=None, level=LEVEL_DEFAULT,
+                 finder=None) -> bytearray:
+    """压缩 window[start:]，window[:start] 只作为字典(即这一段之前的 WINDOW_SIZE 字节)
+
+    base: window[0] 在整个文件中的位置，决定匹配的环形缓冲区位置
+    pad: 不是最后一段时补足记号数为8的倍数，使各段的数据流可以直接首尾相接；
+    此时 len(window) - start 须为8的倍数
+    finder: 在 window 上已建好的匹配查找器(可选)
+    """
+    window = bytes(window)
+    size = len(window)
+    if finder is None:
+        finder = make_finder(window, level, max_chain, start)
+    lengths = []
+    sources = []
+    cursor = start
+    while cursor < size:
+        length, pos = finder.find(cursor)
+        lengths.append(length)
+        sources.append(pos)
+        cursor += length or 1
+    if pad and len(lengths) % 8:
+        _pad_tokens(lengths, sources, -len(lengths) % 8)
+
+    out = bytearray()
+    cursor = start
+    for group in range(0, len(lengths), 8):
+        flag_pos = len(out)
+        out.append(0)
+        flags = 0
+        for bit, length in enumerate(lengths[group:group + 8]):
+            if length:
+                ring = (sources[group + bit] + base + RING_START) & 0xFFF
+                out.append(ring & 0xFF)
+                out.append(((ring >> 4) & 0xF0) | (length - MIN_MATCH_LEN))
+                cursor += length
+            else:
+                flags |= 1 << bit
+                out.append(window[cursor])
+                cursor += 1
+        out[flag_pos] = flags
+    return out.translate(xor_table(key)) if key else out
+
+
+def chunks(data, chunk_size):
+    """把数据分段，返回 encode_chunk 的参数 (window, start, base, pad)，各段结果依次拼接即为完整数据流"""
+    chunk_size = max(8, chunk_size - chunk_size % 8)
+    size = len(data)
+    for begin in range(0, size, chunk_size):
+        end = min(begin + chunk_size, size)
+        base = max(0, begin - WINDOW_SIZE)
+        yield bytes(data[base:end]), begin - base, base, end < size
+
+
+def compress(data, key=XOR_KEY, max_chain=None, level=LEVEL_DEFAULT, finder=None) -> bytes:
+    """压缩并加上 3;1 文件头，level 为 LEVEL_STORE 时存为 3;0"""
+    if level == LEVEL_STORE:
+        return store(data, key)
+    return MAGIC_COMPRESSED + struct.pack('<I', len(data)) + encode(data, key, max_chain, level, finder)
+
+
+def store(data, key=XOR_KEY) -> bytes:
+    """不压缩，仅异或后加上 3;0 文件头"""
+    return MAGIC_STORED + struct.pack('<I', len(data)) + bytes(data).translate(xor_table(key))
+
+
+def estimate(data, blocks=ESTIMATE_BLOCKS, block_size=ESTIMATE_BLOCK_SIZE, max_chain=ESTIMATE_CHAIN) -> float:
+    """均匀抽取几个块试压缩，返回压缩后/压缩前大小之比的估计值
+
+    数据不超过抽样总量时整个试压缩；只取LZSS的实际输出，不看字节熵：
+    LZSS没有熵编码，字节分布不均但没有重复的数据同样压不小
+    """
+    size = len(data)
+    if size == 0:
+        return 1.0
+    if size <= blocks * block_size:
+        samples = [bytes(data)]
+    else:
+        step = (size - block_size) // (blocks - 1)
+        samples = [bytes(data[i * step:i * step + block_size]) for i in range(blocks)]
+    total = sum(len(sample) for sample in samples)
+    packed = sum(len(encode(sample, 0, max_chain)) for sample in samples)
+    return packed / total
@@ -0,0 +1,84 @@
+import os
+import time
+import hashlib
+
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024  # 1GB
+
+
+class CompressCache:
+    """磁盘上的压缩结果缓存，以 内容哈希+压缩参数 为键，超过容量时按最近使用时间淘汰"""
+
+    def __init__(self, root, max_size=DEFAULT_MAX_SIZE):
+        self.root = root
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+        # 路径 -> [最近使用时间, 大小]
+        self._entries = {}
+        self._total = 0
+        for sub in os.scandir(root):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                st = entry.stat()
+                self._entries[entry.path] = [st.st_mtime, st.st_size]
+                self._total += st.st_size
+        if self._total > self.max_size:
+            self.evict(self.max_size * 9 // 10)
+
+    @staticmethod
+    def key(data, params):
+        hasher = hashlib.sha1(params.encode())
+        hasher.update(data)
+        return hasher.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        if path in self._entries:
+            self._entries[path][0] = now
+        self.hits += 1
+        return blob
+
+    def put(self, key, blob):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，中途中断不会留下残缺的缓存
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, path)
+        old = self._entries.get(path)
+        if old:
+            self._total -= old[1]
+        self._entries[path] = [time.time(), len(blob)]
+        self._total += len(blob)
+        if self._total > self.max_size:
+            self.evict(self.max_size * 9 // 10)
+
+    def evict(self, target):
+        for path, (_, size) in sorted(self._entries.items(), key=lambda item: item[1][0]):
+            if self._total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            del self._entries[path]
+            self._total -= size
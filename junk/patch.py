@@ -0,0 +1,168 @@
+import os
+import json
+import struct
+import bisect
+import argparse
+
+import idx
+from archive import Archive, MANIFEST_SUFFIX, align_up, content_digest
+from pfsts import compress
+
+JOURNAL_SUFFIX = '.journal'
+
+
+def slot_capacity(archive, member):
+    """成员所在位置到下一段数据(成员/FSTS/文件末尾)之间可用的字节数，与其他条目共用数据时为0"""
+    if any(m.offset == member.offset and m.path != member.path for m in archive.members):
+        return 0
+    starts = sorted({m.offset for m in archive.members} |
+                    {f.offset for f in archive.folders} | {len(archive.view)})
+    return starts[bisect.bisect_right(starts, member.offset)] - member.offset
+
+
+def idx_writes(idx_filename, folder_name, fst_offset, fst_size, count):
+    """返回idx.dat中对应子封包记录需要写入的内容，出错时返回None"""
+    try:
+        with open(idx_filename, 'rb') as f:
+            index = idx.IdxIndex(f.read())
+    except (OSError, ValueError) as e:
+        print(e)
+        return None
+    records, field = index.records_for(True)
+    addresses = records.get(folder_name)
+    if not addresses:
+        print(f"idx中没有此子封包: {folder_name}")
+        return None
+    return [(idx_filename, address + field * 4, struct.pack('<3I', fst_offset, fst_size, count))
+            for address in addresses]
+
+
+def manifest_writes(manifest_filename, member_path, UncompressSize, digest):
+    """返回校验清单中该文件的新记录需要写入的内容；没有清单时返回[]，清单无法读取时返回None
+
+    新内容比原文件短时用空白补齐，写入始终从文件头开始，回滚时按原长度截断
+    """
+    try:
+        with open(manifest_filename, 'rb') as f:
+            old = f.read()
+    except FileNotFoundError:
+        return []
+    except OSError as e:
+        print(e)
+        return None
+    try:
+        manifest = json.loads(old.decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    manifest[member_path] = [UncompressSize, digest]
+    data = json.dumps(manifest, indent=1, ensure_ascii=False).encode('utf-8')
+    return [(manifest_filename, 0, data + b' ' * (len(old) - len(data)))]
+
+
+def write_journal(journal, writes):
+    """记录每处写入前的原始内容和文件长度，中断后可据此回滚"""
+    entries = []
+    lengths = {}
+    for path, offset, data in writes:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            old = f.read(len(data))
+        entries.append([path, offset, old.hex()])
+        lengths.setdefault(path, os.path.getsize(path))
+    with open(journal, 'w', encoding='utf-8') as f:
+        json.dump({'writes': entries, 'lengths': lengths}, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def rollback(journal):
+    with open(journal, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    for path, offset, old in reversed(state['writes']):
+        with open(path, 'r+b') as f:
+            f.seek(offset)
+            f.write(bytes.fromhex(old))
+    for path, length in state['lengths'].items():
+        with open(path, 'r+b') as f:
+            f.truncate(length)
+    os.remove(journal)
+
+
+def apply_writes(journal, writes):
+    write_journal(journal, writes)
+    for path, offset, data in writes:
+        with open(path, 'r+b') as f:
+            f.seek(offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+    os.remove(journal)
+
+
+def patch(dat_filename, member_path, new_filename, idx_filename=None, max_chain=None):
+    journal = dat_filename + JOURNAL_SUFFIX
+    if os.path.exists(journal):
+        print("发现上次未完成的修改，已回滚")
+        rollback(journal)
+
+    with open(new_filename, 'rb') as f:
+        raw = f.read()
+    compress_data, UncompressSize, size = compress(raw, max_chain)
+    compress_data = bytes(compress_data[:size])
+    digest = content_digest(raw)
+
+    with Archive(dat_filename) as archive:
+        if member_path not in archive:
+            print(f"封包中没有此文件: {member_path}")
+            return False
+        member = archive[member_path]
+        folder = next(f for f in archive.folders if f.name == member.folder)
+        capacity = slot_capacity(archive, member)
+        file_end = len(archive.view)
+
+    if size <= capacity:
+        # 原位覆盖，旧数据多出的部分清零
+        offset = member.offset
+        data = compress_data + b'\x00' * max(member.size - size, 0)
+        mode = "原位覆盖"
+    else:
+        offset = align_up(file_end, 16)
+        data = compress_data + b'\x00' * (align_up(size, 16) - size)
+        mode = "追加到文件末尾"
+    fst_size = max(folder.size, offset + len(data) - folder.offset)
+
+    writes = [(dat_filename, offset, data),
+              (dat_filename, member.entry + 4, struct.pack('<3I', offset - folder.offset, UncompressSize, size))]
+    if fst_size != folder.size:
+        writes.append((dat_filename, folder.record + 3 * 4, struct.pack('<I', fst_size)))
+    if idx_filename:
+        # idx.dat无法同步时整个修改都不做
+        idx_update = idx_writes(idx_filename, folder.name, folder.offset, fst_size, folder.count)
+        if idx_update is None:
+            return False
+        writes += idx_update
+    # 打包时生成的校验清单一并更新，否则verify.py会报此文件不符
+    manifest_filename = dat_filename + MANIFEST_SUFFIX
+    manifest_update = manifest_writes(manifest_filename, member_path, UncompressSize, digest)
+    if manifest_update is not None:
+        writes += manifest_update
+
+    apply_writes(journal, writes)
+    if manifest_update is None:
+        # 清单无法更新，留着只会误报
+        print(f"校验清单无法读取，已删除: {manifest_filename}")
+        os.remove(manifest_filename)
+    print(f"{member_path}: {mode} 0x{offset:x}，原大小 {member.size}，新大小 {size}，"
+          f"共写入 {sum(len(w[2]) for w in writes)} 字节")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="替换dat中的单个文件，能放下时原位覆盖，否则追加到末尾，并同步FSTS/PIDX/idx.dat索引")
+    parser.add_argument('dat', help="目标dat文件")
+    parser.add_argument('member', help="封包内路径，如 'tex/sub/a.agi'")
+    parser.add_argument('newfile', help="新文件")
+    parser.add_argument('-i', '--idx', default=None, help="同时更新的idx.dat")
+    parser.add_argument('--chain', type=int, default=None, help="压缩时哈希链长度上限")
+    args = parser.parse_args()
+    patch(args.dat, args.member, args.newfile, args.idx, args.chain)
@@ -1,183 +1,174 @@
 import os
-import sys
 import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 import ctypes
 import struct
 from typing import Tuple, List
 
-XOR_KEY = 0x72
+import lzss
+from packcache import CompressCache
+import layout
+from archive import Archive, ArchiveWriter, MANIFEST_SUFFIX, checksum, content_digest
+
 BUFFER_SIZE = 16 * 1024 * 1024  # 16MB buffer
-WINDOW_SIZE = 4096
-MAX_MATCH_LEN = 18
-MIN_MATCH_LEN = 3
-
-class SlidingWindow:
-    def __init__(self):
-        self.data = bytearray(WINDOW_SIZE)
-        self.pos = 0xFEE
-        self.size = 0
-
-def window_init(window: SlidingWindow) -> None:
-    for i in range(WINDOW_SIZE):
-        window.data[i] = 0
-    window.pos = 0xFEE
-    window.size = 0
-
-def window_update(window: SlidingWindow, byte: int) -> None:
-    window.data[window.pos] = byte
-    window.pos = (window.pos + 1) % WINDOW_SIZE
-    if window.size < WINDOW_SIZE:
-        window.size += 1
-
-def find_match(window: SlidingWindow, input_data: bytearray, cursor: int, end: int) -> Tuple[int, int]:
-    max_len = 0
-    max_pos = 0
-    search_start = (cursor - (WINDOW_SIZE - 8)) if (cursor >= (WINDOW_SIZE - 8)) else 0
-    
-    for i in range(search_start, cursor):
-        length = 0
-        while (length < MAX_MATCH_LEN and 
-               i + length < cursor and 
-               cursor + length < end and 
-               input_data[i + length] == input_data[cursor + length]):
-            length += 1
-        
-        if length > max_len:
-            max_len = length
-            max_pos = i
-    
-    distance = (window.pos - (cursor - max_pos)) % WINDOW_SIZE
-    return (max_len, distance) if max_len >= MIN_MATCH_LEN else (0, 0)
+# 不小于此大小的文件压缩前先抽样估计压缩比；估计值不低于 INCOMPRESSIBLE_RATIO 时不压缩
+ESTIMATE_MIN_SIZE = 64 * 1024
+INCOMPRESSIBLE_RATIO = 1.0
+# 不小于此大小的文件在有多个进程时分段并行压缩
+CHUNK_SIZE = 256 * 1024
+PARALLEL_MIN_SIZE = 2 * CHUNK_SIZE
+
+def compress_level(input_data, max_chain=None, level=lzss.LEVEL_DEFAULT):
+    if level != lzss.LEVEL_OPTIMAL:
+        return lzss.compress(input_data, max_chain=max_chain, level=level)
+    # 最优解析：顺带报告比贪心解析小了多少
+    parser = lzss.OptimalParser(bytes(input_data), max_chain)
+    output = lzss.compress(input_data, max_chain=max_chain, level=level, finder=parser)
+    report_gain(parser.greedy_size, len(output))
+    return output
+
+
+def report_gain(greedy_size, size):
+    saved = greedy_size - size
+    print(f"  贪心 {greedy_size} -> 最优 {size}，减少 {saved} 字节 "
+          f"({saved * 100 / max(greedy_size, 1):.2f}%)")
+
+
+def _chunk_task(task):
+    """返回 (该段数据流, 贪心解析的大小)，后者只在最优解析时给出"""
+    window, start, base, pad, max_chain, level = task
+    if level != lzss.LEVEL_OPTIMAL:
+        return lzss.encode_chunk(window, start, base, pad, max_chain=max_chain, level=level), None
+    parser = lzss.OptimalParser(window, max_chain, start)
+    output = lzss.encode_chunk(window, start, base, pad, max_chain=max_chain, level=level, finder=parser)
+    return output, parser.greedy_size - lzss.HEADER_SIZE
+
+
+def compress_parallel(input_data, pool, max_chain=None, level=lzss.LEVEL_DEFAULT):
+    """分段并行压缩：每段以前面的4KB为字典，各段补齐控制字节分组后直接拼接"""
+    tasks = [(window, start, base, pad, max_chain, level)
+             for window, start, base, pad in lzss.chunks(input_data, CHUNK_SIZE)]
+    print(f"  分 {len(tasks)} 段并行压缩")
+    parts, greedy_sizes = zip(*pool.map(_chunk_task, tasks))
+    output = lzss.MAGIC_COMPRESSED + struct.pack('<I', len(input_data)) + b''.join(parts)
+    if level == lzss.LEVEL_OPTIMAL:
+        # 与单进程时相同，报告比贪心解析小了多少(各段分别计算后相加)
+        report_gain(lzss.HEADER_SIZE + sum(greedy_sizes), len(output))
+    return output
 
-def compress(input_data: bytearray) -> Tuple[bytearray, int]:
+
+def compress(input_data: bytearray, max_chain=None, cache=None, level=lzss.LEVEL_DEFAULT,
+             estimate_ratio=INCOMPRESSIBLE_RATIO, stats=None, pool=None) -> Tuple[bytearray, int, int]:
+    """estimate_ratio: 抽样估计的压缩比不低于此值时直接存为3;0，为None时不估计
+    stats: 累计估计/压缩耗时，供打包结束时报告
+    pool: 进程池，较大的文件分段并行压缩
+    """
     input_size = len(input_data)
 
-    if input_data[:4] == b'\x20\x33\x3B\x31' or input_data[:4] == b'\x20\x33\x3B\x30':
+    if lzss.is_packed(input_data):
         
         return input_data, int.from_bytes(input_data[4:8], 'little'), input_size
     
-    
-    # Estimate max output size (input_size * 1.5 + 8)
-    max_output_size = input_size + (input_size // 2) + 8
-    output = bytearray(max_output_size)
-    
-    # Write header magic and original size
-    output[0:4] = b'\x20\x33\x3B\x31'
-    output[4:8] = struct.pack('<I', input_size)
-    
-    window = SlidingWindow()
-    window_init(window)
-    
-    read_pos = 0
-    output_pos = 8
-    control_mask = 0
-    control_bit = 0
-    data_buffer = bytearray()
-    
-    while read_pos < input_size:
-        match_len, distance = 0, 0
-        if window.size >= MIN_MATCH_LEN:
-            match_len, distance = find_match(window, input_data, read_pos, input_size)
-        
-        if match_len >= MIN_MATCH_LEN:
-            control_mask |= (0 << control_bit)
-            
-            byte1 = distance & 0xFF
-            byte2 = ((distance >> 4) & 0xF0) | ((match_len - 3) & 0x0F)
-            
-            data_buffer.append(byte1 ^ XOR_KEY)
-            data_buffer.append(byte2 ^ XOR_KEY)
-            
-            for i in range(match_len):
-                window_update(window, input_data[read_pos + i])
-            read_pos += match_len
-        else:
-            control_mask |= (1 << control_bit)
-            
-            value = input_data[read_pos]
-            data_buffer.append(value ^ XOR_KEY)
-            
-            window_update(window, value)
-            read_pos += 1
-        
-        control_bit += 1
-        
-        if control_bit >= 8:
-            ctrl_byte = control_mask ^ XOR_KEY
-            output[output_pos] = ctrl_byte
-            output_pos += 1
-            
-            output[output_pos:output_pos+len(data_buffer)] = data_buffer
-            output_pos += len(data_buffer)
-            
-            control_mask = 0
-            control_bit = 0
-            data_buffer = bytearray()
-    
-    if control_bit != 0:
-        while control_bit < 8:
-            control_mask |= (0 << control_bit)
-            control_bit += 1
-        
-        ctrl_byte = control_mask ^ XOR_KEY
-        output[output_pos] = ctrl_byte
-        output_pos += 1
-        
-        output[output_pos:output_pos+len(data_buffer)] = data_buffer
-        output_pos += len(data_buffer)
-    
-    # Trim the output buffer to actual size
-    
-    return output, input_size, output_pos
+    if level == lzss.LEVEL_STORE:
+        output = lzss.store(input_data)
+        return output, input_size, len(output)
 
+    # 相同内容+相同压缩参数直接取缓存
+    if cache is not None:
+        params = f"lzss:{lzss.XOR_KEY:02x}:{max_chain}"
+        if level != lzss.LEVEL_DEFAULT:
+            params += f":level{level}"
+        # 是否存为3;0取决于估计的阈值，阈值不同(或不估计)时不能共用缓存
+        params += f":estimate{estimate_ratio}" if estimate_ratio is not None else ":noestimate"
+        key = cache.key(input_data, params)
+        output = cache.get(key)
+        if output is not None:
+            return output, input_size, len(output)
 
-def read_int(f, address=None):
-    if address is None:
-        return int.from_bytes(f.read(4), 'little')
-    else:
-        return int.from_bytes(f[address:address+4], 'little')
+    if stats is None:
+        stats = {}
+    # 较大的文件先抽样试压缩，明显压不小的(音频、已压缩的数据等)不做完整的匹配查找
+    if estimate_ratio is not None and input_size >= ESTIMATE_MIN_SIZE:
+        start = time.perf_counter()
+        ratio = lzss.estimate(input_data)
+        stats['estimate_time'] = stats.get('estimate_time', 0.0) + time.perf_counter() - start
+        if ratio >= estimate_ratio:
+            print(f"  估计压缩比 {ratio:.2f}，不压缩")
+            stats['skipped'] = stats.get('skipped', 0) + 1
+            stats['skipped_bytes'] = stats.get('skipped_bytes', 0) + input_size
+            output = lzss.store(input_data)
+            return output, input_size, len(output)
 
-def write_int(file, content, address=None):
-    if address is None:
-        return
+    start = time.perf_counter()
+    if pool is not None and input_size >= PARALLEL_MIN_SIZE:
+        output = compress_parallel(input_data, pool, max_chain, level)
     else:
-        cmd =  content.to_bytes(4, 'little')
-        file[address:address+len(cmd)] = cmd
-        return 
-    
-def packfsts(dir, list):
-    data = bytearray(0x20 + len(list) * 4 * 4)
-    data[0:4] = b"FSTS"
-    write_int(data,len(list),0x4)
-    write_int(data,0x20,0x8)
-    str_start = len(data)
-    write_int(data,str_start,0xC)
-    
-    
-    addr = 16
-    for filename, Ofilename in list:
-        addr += 16
-        write_int(data,len(data) - str_start,addr)
-        data.extend(Ofilename.encode()+b'\x00')
-    write_int(data,len(data)-str_start,0x10)
-    data = data + b'\x00' * ((16 - (len(data) % 16)) % 16)
-    
-    addr = 16
-    for filename, Ofilename in list:
-        addr += 16
-        print(os.path.join(dir,filename))
-        compress_data, UncompressSize, size = compress(open(os.path.join(dir,filename), 'rb').read())
-        write_int(data,len(data),addr + 4)
-        write_int(data,UncompressSize,addr + 8)
-        write_int(data,size,addr + 12)
-        data = (data + compress_data) + b'\x00' * ((16 - (len(data + compress_data) % 16)) % 16)
+        output = compress_level(input_data, max_chain, level)
+    stats['compress_time'] = stats.get('compress_time', 0.0) + time.perf_counter() - start
+    stats['compressed_bytes'] = stats.get('compressed_bytes', 0) + input_size
+    if len(output) > input_size + lzss.HEADER_SIZE:
+        # 压缩后反而变大，改为3;0
+        stats['expanded'] = stats.get('expanded', 0) + 1
+        output = lzss.store(input_data)
+    if cache is not None:
+        cache.put(key, output)
+    return output, input_size, len(output)
 
 
-    return data
+def report_estimate(stats):
+    """报告可压缩性估计跳过了多少文件、大约省下多少时间"""
+    skipped = stats.get('skipped', 0)
+    if skipped:
+        estimate_time = stats.get('estimate_time', 0.0)
+        line = f"可压缩性估计：{skipped} 个文件({stats['skipped_bytes']} 字节)直接存为3;0，估计耗时 {estimate_time:.2f}s"
+        if stats.get('compress_time'):
+            # 按本次实际的压缩速度推算这些文件完整压缩所需的时间
+            speed = stats['compressed_bytes'] / stats['compress_time']
+            line += f"，约节省 {max(0.0, stats['skipped_bytes'] / speed - estimate_time):.2f}s"
+        print(line)
+    if stats.get('expanded'):
+        print(f"{stats['expanded']} 个文件压缩后变大，已改为3;0")
 
 
-def pack(input_dir, packname):
+def packfsts(writer, dir, name, list, max_chain=None, cache=None, manifest=None, level=lzss.LEVEL_DEFAULT, written=None, order=None,
+             estimate_ratio=INCOMPRESSIBLE_RATIO, stats=None, pool=None):
+    """written: 整个封包共用的 内容哈希 -> (文件中地址, 原始大小, 大小)，为None时不去重
+    order: 数据的写出顺序(list中的下标)，默认按list顺序；条目表顺序不变
+    """
+    list = [*list]
+    writer.begin_folder(name, [Ofilename for filename, Ofilename in list])
+    for index in (order if order is not None else range(len(list))):
+        filename, Ofilename = list[index]
+        print(os.path.join(dir,filename))
+        with open(os.path.join(dir,filename), 'rb') as f:
+            raw = f.read()
+        digest = checksum(raw) if written is not None else None
+        if digest is not None and digest in written:
+            address, UncompressSize, size = written[digest]
+            if address >= writer.fst_offset:
+                # 同一FSTS内的重复文件共用一份数据
+                writer.reuse(address - writer.fst_offset, UncompressSize, size, index)
+            else:
+                # 其他FSTS里已有，复制压缩结果，不再压缩；本FSTS内再遇到时共用这份
+                offset = writer.add(writer.read_back(address, size), UncompressSize, index)
+                written[digest] = writer.fst_offset + offset, UncompressSize, size
+        else:
+            compress_data, UncompressSize, size = compress(raw, max_chain, cache, level, estimate_ratio, stats, pool)
+            offset = writer.add(compress_data[:size], UncompressSize, index)
+            if digest is not None:
+                written[digest] = writer.fst_offset + offset, UncompressSize, size
+        if manifest is not None:
+            # 记录解压后内容的校验值
+            manifest[name + '/' + Ofilename] = [UncompressSize, content_digest(raw)]
+    writer.end_folder()
+
+
+def pack(input_dir, packname, max_chain=None, cache=None, level=lzss.LEVEL_DEFAULT, dedup=True,
+         strategy='list', trace=None, sector=None, align_members=False, estimate_ratio=INCOMPRESSIBLE_RATIO,
+         jobs=1):
     try:
         with open(input_dir + '/list.json', 'r', encoding='utf-8') as file:
             list = json.load(file)
@@ -190,53 +181,78 @@ def pack(input_dir, packname):
     except Exception as e:
         print(f"读取文件时发生错误: {e}")
         return
-    data = bytearray()
-    data[0:] = bytes.fromhex(list['start'])
+    header = bytes.fromhex(list['start'])
     del list['start']
-    IdxQ = len(list)
-    data.extend((IdxQ * 4  + 4 + IdxQ * 5 * 4) * b'\x00')
-    
-    #data[read_int(data, 0x18):] = b'\x00' * 6 * 4 * IdxQ
-    idx_start = read_int(data, 0xC)
-    write_int(data, IdxQ, 0x50)
-    str_start = len(data)
-    write_int(data, str_start, 0x20)
-    data.extend(packname.encode()+b'\x00')
-
-    addr = 0
-    for key, value in list.items():
+    folders = [key for key, value in list.items() if isinstance(value, dict)]
+    for key in folders:
         print(key)
-        if isinstance(value, dict):
-            idx_addr = 0x54 + 4  * addr
-            idx_addr2 =  0x54 + 4  * IdxQ + 4 * addr * 5
-            write_int(data,len(data) - str_start, idx_addr2)
-            write_int(data, idx_addr2 - 0x50, idx_addr)
-            data.extend(key.encode()+b'\x00')
-            addr += 1
-    write_int(data,len(data)-str_start,0x24)
-    data = data + b'\x00' * ((16 - (len(data) % 16)) % 16)
-
-    addr = 0
-    for key, value in list.items():
-        if isinstance(value, dict):
-            #data += b'\x00' * ((2048 - (len(data) % 2048)) % 2048)
-            idx_addr = 0x54 + 4  * addr
-            idx_addr2 =  0x54 + 4  * IdxQ + 4 * addr * 5
-            write_int(data, len(data), idx_addr2 + 8)
-            fsts_data = packfsts(os.path.join(input_dir,key), value.items())
-            fsts_data = fsts_data + b'\x00' * ((16 - (len(fsts_data) % 16)) % 16)
-            write_int(data, len(fsts_data), idx_addr2 + 12)
-            write_int(data, len(value), idx_addr2 + 16)
-            data.extend(fsts_data)
-            
-            addr += 1
-
-    with open(packname, 'wb') as f:
-        f.write(data)
+
+    # 数据写出顺序：按list.json / 大小分档 / 访问记录
+    members = {key: [*list[key].values()] for key in folders}
+    sizes = {}
+    if strategy == 'size':
+        for key in folders:
+            for filename, Ofilename in list[key].items():
+                sizes[key + '/' + Ofilename] = os.path.getsize(os.path.join(input_dir, key, filename))
+    write_order, member_order = layout.plan(folders, members, strategy, trace, sizes)
+
+    # 成员逐个压缩后直接写入文件，内存占用只与最大的单个成员有关
+    manifest = {}
+    written = {} if dedup else None
+    stats = {}
+    pool = ProcessPoolExecutor(jobs) if jobs > 1 else None
+    try:
+        with ArchiveWriter(packname, header, packname, folders) as writer:
+            if sector:
+                # 按扇区对齐每个FSTS(及每个成员)的起始位置
+                writer.align = sector
+                if align_members:
+                    writer.member_align = sector
+            for key in write_order:
+                packfsts(writer, os.path.join(input_dir,key), key, list[key].items(), max_chain, cache, manifest, level,
+                         written, member_order[key], estimate_ratio, stats, pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # 每个成员的 原始大小/校验值，供 verify.py 校验
+    with open(packname + MANIFEST_SUFFIX, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, ensure_ascii=False)
+
+    if written is not None:
+        print(f"去重：{len(manifest)} 个文件中有 {len(manifest) - len(written)} 个重复，只压缩一次")
+    report_estimate(stats)
+    if cache is not None:
+        print(f"压缩缓存：命中 {cache.hits}，未命中 {cache.misses}")
+    if trace is not None:
+        with Archive(packname) as archive:
+            layout.report(layout.simulate(archive, trace, sector or layout.SECTOR_SIZE))
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("用法：\n封包：打包目录 封包文件")
-    else:
-        pack(sys.argv[1],sys.argv[2])
+    parser = argparse.ArgumentParser(description="封包：打包目录 封包文件")
+    parser.add_argument('input_dir', help="打包目录")
+    parser.add_argument('packname', help="封包文件")
+    parser.add_argument('--chain', type=int, default=None,
+                        help="每次匹配查找最多遍历的哈希链长度，越小越快但压缩率略低 (默认不限)")
+    parser.add_argument('-l', '--level', type=int, choices=(0, 1, 2, 3), default=lzss.LEVEL_DEFAULT,
+                        help="压缩等级：0 不压缩(3;0)，1 快速(每处只试一个候选)，2 默认(查找最长匹配)，3 最优解析(最小，最慢)")
+    parser.add_argument('--no-dedup', action='store_true', help="不合并内容相同的文件")
+    parser.add_argument('--layout', choices=layout.STRATEGIES, default='list',
+                        help="数据排列方式：list 按list.json，size 子封包内按大小分档，trace 按访问记录 (默认list)")
+    parser.add_argument('--trace', default=None, help="访问记录，每行一个 目录名/文件名；打包后按此模拟读取耗时")
+    parser.add_argument('--sector', type=int, default=None, help="按扇区大小对齐每个FSTS，如2048")
+    parser.add_argument('--align-members', action='store_true', help="每个成员也按扇区对齐 (需--sector)")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help=f"并行压缩的进程数，不小于{PARALLEL_MIN_SIZE // 1024}KB的文件分段并行压缩 (默认1, 0为CPU核心数)")
+    parser.add_argument('--no-estimate', action='store_true', help="不做可压缩性估计，所有文件都完整压缩")
+    parser.add_argument('--cache', default=None, help="压缩缓存目录，未改动的文件直接复用上次的压缩结果")
+    parser.add_argument('--cache-size', type=int, default=1024, help="压缩缓存容量上限 (MB，默认1024)")
+    args = parser.parse_args()
+    cache = CompressCache(args.cache, args.cache_size * 1024 * 1024) if args.cache else None
+    trace = layout.load_trace(args.trace) if args.trace else None
+    if args.layout == 'trace' and trace is None:
+        parser.error("--layout trace 需要 --trace")
+    pack(args.input_dir, args.packname, args.chain, cache, args.level, not args.no_dedup,
+         args.layout, trace, args.sector, args.align_members, None if args.no_estimate else INCOMPRESSIBLE_RATIO,
+         args.jobs or os.cpu_count())
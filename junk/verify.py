@@ -0,0 +1,124 @@
+import os
+import sys
+import json
+import struct
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import lzss
+import idx
+from archive import Archive, MANIFEST_SUFFIX, checksum, open_worker_archives, worker_view
+
+def check_member(view, offset, size):
+    """解压一个成员，返回 (解压后长度, 校验值, 错误信息)"""
+    try:
+        data = lzss.unpack(view[offset:offset + size])
+    except Exception as e:
+        return 0, None, f"解压失败: {e}"
+    return len(data), checksum(data), None
+
+def _check_task(task):
+    offset, size = task
+    return check_member(worker_view(), offset, size)
+
+
+def load_manifest(filename):
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except json.JSONDecodeError:
+        print(f"校验清单不是有效的 JSON 格式: {filename}")
+        return None
+
+
+def check_idx(dat_filename, idx_filename):
+    """对照idx.dat中该dat的记录，返回不一致项的说明"""
+    result = idx.dat_up(dat_filename)
+    if result is None:
+        return [f"无法读取dat索引: {dat_filename}"]
+    dat_type, dat_dict = result
+    errors = []
+    with open(idx_filename, 'rb') as f:
+        buf = f.read()
+    try:
+        index = idx.IdxIndex(buf)
+    except ValueError as e:
+        return [str(e)]
+    dat_sign = index.dat_sign(dat_filename)
+    if dat_sign is None:
+        return [f"idx中没有此dat文件: {dat_filename}"]
+
+    records, field = index.records_for(dat_type, dat_sign)
+    for name, values in dat_dict.items():
+        addresses = records.get(name)
+        if not addresses:
+            errors.append(f"idx中没有: {name}")
+            continue
+        for address in addresses:
+            found = struct.unpack_from('<3I', buf, address + field * 4)
+            if found != tuple(values):
+                errors.append(f"idx记录不一致: {name} idx={found} dat={tuple(values)}")
+    return errors
+
+
+def verify(dat_filename, manifest_filename=None, idx_filename=None, jobs=1):
+    """校验dat中每个成员能否解压、长度是否与索引一致、内容是否与打包时的校验清单一致，返回错误数"""
+    if manifest_filename is None:
+        manifest_filename = dat_filename + MANIFEST_SUFFIX
+    manifest = load_manifest(manifest_filename)
+    if manifest is None:
+        print(f"没有校验清单，只检查解压长度: {manifest_filename}")
+
+    try:
+        archive = Archive(dat_filename)
+    except ValueError as e:
+        print(e)
+        return 1
+
+    errors = []
+    with archive:
+        members = list(archive.members)
+        tasks = [(m.offset, m.size) for m in members]
+        if jobs > 1:
+            # 每个进程各自mmap一次dat，只传偏移和大小
+            chunksize = max(1, len(tasks) // (jobs * 8))
+            with ProcessPoolExecutor(jobs, initializer=open_worker_archives, initargs=(dat_filename,)) as pool:
+                results = list(pool.map(_check_task, tasks, chunksize=chunksize))
+        else:
+            results = [check_member(archive.view, offset, size) for offset, size in tasks]
+
+    for member, (length, digest, error) in zip(members, results):
+        if error:
+            errors.append(f"{member.path}: {error}")
+            continue
+        if length != member.uncompressed_size:
+            errors.append(f"{member.path}: 解压后长度 {length}，索引中为 {member.uncompressed_size}")
+        if manifest is not None:
+            expected = manifest.get(member.path)
+            if expected is None:
+                errors.append(f"{member.path}: 校验清单中没有此文件")
+            elif expected[1] != digest:
+                errors.append(f"{member.path}: 校验值不符")
+    if manifest is not None:
+        for path in manifest.keys() - {m.path for m in members}:
+            errors.append(f"{path}: 封包中缺少此文件")
+
+    if idx_filename:
+        errors += check_idx(dat_filename, idx_filename)
+
+    for error in errors:
+        print(error)
+    print(f"{dat_filename}: 共 {len(members)} 个文件，{len(errors)} 处错误")
+    return len(errors)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="校验dat：并行解压全部成员，对照索引、打包时的校验清单和idx.dat")
+    parser.add_argument('dat', help="目标dat文件")
+    parser.add_argument('-m', '--manifest', default=None, help=f"校验清单 (默认为 dat文件名{MANIFEST_SUFFIX})")
+    parser.add_argument('-i', '--idx', default=None, help="同时对照的idx.dat")
+    parser.add_argument('-j', '--jobs', type=int, default=0, help="并行解压的进程数 (默认0为CPU核心数)")
+    args = parser.parse_args()
+    sys.exit(1 if verify(args.dat, args.manifest, args.idx, args.jobs or os.cpu_count()) else 0)
@@ -63,6 +63,10 @@ def process_folder(input_folder, output_folder):
                 write_to_json(json_data, output_path)
 
 # 使用示例
-input_folder = sys.argv[1]
-json_output_folder = sys.argv[2]
-process_folder(input_folder, json_output_folder)
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("用法:  <tbl目录> <json输出目录>")
+        sys.exit(1)
+    input_folder = sys.argv[1]
+    json_output_folder = sys.argv[2]
+    process_folder(input_folder, json_output_folder)
@@ -217,16 +217,20 @@ def process_reverse(original_folder, json_folder, output_folder):
                     print(f"Original file not found: {original_tbl_path}")
 
 # 使用示例
-original_folder = 'slg'  # 原始tbl文件目录
-json_folder = 'slg_tbl'  # JSON翻译文件目录
-output_folder = 'new_slg'  # 输出翻译后的tbl文件目录
-
-code_table_path = "TargetTblFile.tbl"
+if __name__ == "__main__":
+    original_folder = 'slg'  # 原始tbl文件目录
+    json_folder = 'slg_tbl'  # JSON翻译文件目录
+    output_folder = 'new_slg'  # 输出翻译后的tbl文件目录
+    if len(sys.argv) == 4:
+        # 也可以在命令行指定：原始目录 json目录 输出目录
+        original_folder, json_folder, output_folder = sys.argv[1:4]
+
+    code_table_path = "TargetTblFile.tbl"
     
-try:
-    code_dict = load_code_table(code_table_path)
-except Exception as e:
-    print(f"加载码表失败: {e}")
-    sys.exit(1)
+    try:
+        code_dict = load_code_table(code_table_path)
+    except Exception as e:
+        print(f"加载码表失败: {e}")
+        sys.exit(1)
 
-process_reverse(original_folder, json_folder, output_folder)
\ No newline at end of file
+    process_reverse(original_folder, json_folder, output_folder)
\ No newline at end of file